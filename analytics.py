@@ -0,0 +1,241 @@
+import datetime
+from helpers import Player, sessionOpen
+
+# Optional, the statistics of all players are computed on whole arrays with it.
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# Aggregations of the session data of analyze.py, kept apart from any
+# plotting so they can be precomputed, e.g. for the website. Sessions are
+# epoch seconds in UTC, days are counted since the epoch.
+secondsPerDay = 24*3600
+epoch = datetime.date(1970, 1, 1)
+
+
+
+def dayOf(seconds: int):
+  return epoch + datetime.timedelta(days=seconds // secondsPerDay)
+
+
+def dailyPlaytime(player: Player):
+  """Sums up the playtime of a player per day. Sessions crossing midnight
+  count towards both days. Sessions that never ended are skipped.
+
+  :return: Dict of dates to seconds played, in chronological order.
+  """
+  seconds = {}
+  for start,end in player.sessions():
+    if end == sessionOpen:
+      continue
+    while start < end:
+      day = start // secondsPerDay
+      dayEnd = (day + 1) * secondsPerDay
+      seconds[day] = seconds.get(day, 0) + min(end, dayEnd) - start
+      start = dayEnd
+  return {epoch + datetime.timedelta(days=day): s for day,s in sorted(seconds.items())}
+
+
+def sessionArrays(players: list):
+  """Converts the sessions of all players that ended to arrays.
+
+  :return: Tuple of arrays of the start, the end and the index of the
+           player within players of every session.
+  """
+  starts = numpy.concatenate([numpy.frombuffer(p.sessionStarts, dtype=numpy.int64) for p in players] or [[]])
+  ends = numpy.concatenate([numpy.frombuffer(p.sessionEnds, dtype=numpy.int64) for p in players] or [[]])
+  owners = numpy.repeat(numpy.arange(len(players)), [len(p.sessionStarts) for p in players])
+  ended = ends != sessionOpen
+  return starts[ended].astype(numpy.int64), ends[ended].astype(numpy.int64), owners[ended]
+
+
+def dailyPlaytimes(players: list, firstDate: datetime.date, lastDate: datetime.date):
+  """Sums up the playtime of all players per day, like dailyPlaytime()
+  but for all players at once. Needs NumPy.
+
+  :param players: List of Player.
+  :return: Tuple of the list of dates from firstDate to lastDate and an
+           array of the seconds played, with a row per player and a
+           column per date.
+  """
+  firstDay = (firstDate - epoch).days
+  nDays = (lastDate - firstDate).days + 1
+  dates = [firstDate + datetime.timedelta(days=i) for i in range(nDays)]
+  starts, ends, owners = sessionArrays(players)
+
+  # Cut the sessions to the date range.
+  starts = numpy.maximum(starts, firstDay * secondsPerDay)
+  ends = numpy.minimum(ends, (firstDay + nDays) * secondsPerDay)
+  inRange = starts < ends
+  starts, ends, owners = starts[inRange], ends[inRange], owners[inRange]
+
+  # Days of the first and the last second of each session.
+  firstDays = starts // secondsPerDay - firstDay
+  lastDays = (ends - 1) // secondsPerDay - firstDay
+  # One more column, so days after the last session day can be indexed.
+  width = nDays + 1
+
+  def add(days, seconds):
+    return numpy.bincount(owners * width + days, weights=seconds, minlength=len(players) * width)
+
+  # A session within a single day only adds to that day. Other sessions
+  # add the rest of their first day, the start of their last day and
+  # whole days in between. The whole days are added as +1 after the
+  # first and -1 at the last day, summed up along the days.
+  midnights = (firstDays + firstDay + 1) * secondsPerDay
+  crossing = firstDays != lastDays
+  playtimes = add(firstDays, numpy.minimum(ends, midnights) - starts)
+  playtimes += add(lastDays, numpy.where(crossing, ends - (lastDays + firstDay) * secondsPerDay, 0))
+  wholeDays = add(firstDays + 1, crossing * secondsPerDay) - add(lastDays, crossing * secondsPerDay)
+  playtimes = playtimes.reshape(len(players), width) + numpy.cumsum(wholeDays.reshape(len(players), width), axis=1)
+  return dates, playtimes[:, :nDays]
+
+
+def timeOfDayOccupancy(starts, ends, owners, nOwners: int, step: int):
+  """Counts for every time of day in steps of step seconds, how many
+  sessions included it. Needs NumPy.
+
+  Sessions are sampled at all multiples of step from their start to their
+  end, both inclusive. Instead of walking through the samples, every
+  session adds one to each time of day for every whole day it lasts, and
+  one more to the range of its remaining samples. The ranges are added
+  as +1/-1 at their bounds and summed up along the day.
+
+  :param starts, ends: Arrays of epoch seconds of the sessions.
+  :param owners: Array of the owner of each session, from 0 to nOwners - 1.
+  :param step: Seconds between samples, has to divide a day.
+  :return: Array of sample counts with a row per owner and a column per step.
+  """
+  nSteps = secondsPerDay // step
+  width = nSteps + 1
+  firstSamples = -(-starts // step)
+  nSamples = numpy.maximum(ends // step - firstSamples + 1, 0)
+  wholeDays, rest = numpy.divmod(nSamples, nSteps)
+  first = firstSamples % nSteps
+
+  def add(steps, counts):
+    return numpy.bincount(owners * width + steps, weights=counts, minlength=nOwners * width)
+
+  # Remaining samples wrapping around midnight are split in two ranges.
+  last = first + rest
+  wraps = last > nSteps
+  bounds = add(first, numpy.ones(len(first))) - add(numpy.minimum(last, nSteps), numpy.ones(len(first)))
+  bounds += add(numpy.zeros(len(first), dtype=numpy.int64), wraps) - add(numpy.where(wraps, last - nSteps, 0), wraps)
+  counts = numpy.cumsum(bounds.reshape(nOwners, width), axis=1)[:, :nSteps]
+  return counts + numpy.bincount(owners, weights=wholeDays, minlength=nOwners)[:, None]
+
+
+def onlineProbability(players: list, step: int, days: int = 7*4*3, now: int = None):
+  """Probability of players being online at each time of day, over the
+  sessions that started within the last days. Needs NumPy.
+
+  :param players: List of Player.
+  :param step: Seconds between the sampled times of day, has to divide a day.
+  :param now: Epoch seconds the days are counted back from, defaults to now.
+  :return: Tuple of the array of sampled seconds of the day and an array
+           of the probabilities in percent, with a row per player.
+  """
+  if now is None:
+    now = int(datetime.datetime.now(datetime.UTC).timestamp())
+  starts, ends, owners = sessionArrays(players)
+  recent = starts >= now - days * secondsPerDay
+  counts = timeOfDayOccupancy(starts[recent], ends[recent], owners[recent], len(players), step)
+  return numpy.arange(0, secondsPerDay, step), counts / days * 100
+
+
+def concurrency(players: list, since: int = 0):
+  """Sweeps over the start and end of all sessions that ended, in time
+  order, keeping count of the players online in between. Only sessions
+  ending after the minute before since are swept, the ones running at
+  that time start there.
+
+  :param players: List of Player.
+  :param since: Only return rows from the minute and the day of these
+                epoch seconds on.
+  :return: Tuple of
+           - the list of (minute, players online) where minute is in
+             epoch seconds and players online is the most players online
+             within the minute. Minutes are only listed when the number
+             differs from the minute listed before.
+           - the list of (day, peak, peak time) of all days on which
+             anybody was online, with days counted since the epoch and
+             the peak time in epoch seconds.
+  """
+  sinceMinute = since // 60
+  sinceDay = since // secondsPerDay
+  # The minute before since decides whether the first minute is listed.
+  cutoff = min(sinceDay * secondsPerDay, (sinceMinute - 1) * 60)
+
+  events = []
+  for p in players:
+    starts, ends = p.sessionStarts, p.sessionEnds
+    # Only the last session of a player is ever ended, so the sessions
+    # that ended are in chronological order.
+    for i in range(len(ends) - 1, -1, -1):
+      end = ends[i]
+      if end == sessionOpen:
+        continue
+      if end <= cutoff:
+        break
+      if end <= starts[i]:
+        continue
+      events.append((max(starts[i], cutoff), 1))
+      events.append((end, -1))
+  events.sort()
+
+  minuteRows = []
+  dayRows = []
+  # Nobody is online before the first event.
+  lastOnline = 0
+  minute = day = None
+  minuteMax = dayPeak = dayPeakTime = 0
+
+  def addMinute(minute, online):
+    nonlocal lastOnline
+    if online != lastOnline:
+      if minute >= sinceMinute:
+        minuteRows.append((minute * 60, online))
+      lastOnline = online
+
+  def hold(start, end, online):
+    """The number of players online stayed the same from start to end."""
+    nonlocal minute, minuteMax, day, dayPeak, dayPeakTime
+    first, last = start // 60, (end - 1) // 60
+    if first != minute:
+      if minute is not None:
+        addMinute(minute, minuteMax)
+      minute = first
+      minuteMax = online
+    minuteMax = max(minuteMax, online)
+    if last != first:
+      addMinute(first, minuteMax)
+      if last > first + 1:
+        # The whole minutes in between.
+        addMinute(first + 1, online)
+      minute = last
+      minuteMax = online
+    if not online:
+      return
+    for d in range(start // secondsPerDay, (end - 1) // secondsPerDay + 1):
+      if d != day:
+        if day is not None and dayPeak and day >= sinceDay:
+          dayRows.append((day, dayPeak, dayPeakTime))
+        day = d
+        dayPeak = 0
+      if online > dayPeak:
+        dayPeak = online
+        dayPeakTime = max(start, d * secondsPerDay)
+
+  online = 0
+  for i,(t,delta) in enumerate(events):
+    if i and t != events[i - 1][0]:
+      hold(events[i - 1][0], t, online)
+    online += delta
+  if events:
+    # Nobody is online after the last session ended.
+    hold(events[-1][0], events[-1][0] + 60, online)
+    addMinute(minute, minuteMax)
+    if dayPeak and day >= sinceDay:
+      dayRows.append((day, dayPeak, dayPeakTime))
+  return minuteRows, dayRows
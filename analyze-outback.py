@@ -1,10 +1,24 @@
 #!/usr/bin/env python3
 import math
 from mtschem import mtschem
+import spatial
 import database
 import configmanager
 
+# Optional, the block statistics are computed on whole arrays with it and
+# the schematic is loaded from a memory mapped cache.
+try:
+  import numpy
+  import schemcache
+except ImportError:
+  numpy = None
+
 def count_blocks(schematic):
+  if numpy:
+    nodes = numpy.asarray(schematic.data["node"])
+    occurances = numpy.bincount(nodes.ravel(order="K"), minlength=len(schematic.nodes)).tolist()
+    return {name: n for name,n in zip(schematic.nodes, occurances)}
+
   occurances = [0 for name in schematic.nodes]
 
   for x, xd in enumerate(schematic.data["node"]):
@@ -15,7 +29,21 @@ def count_blocks(schematic):
   return stats
 
 
+def get_position_arrays(schematic, ids: list):
+  """:return: Dict of node names to arrays of the (x, y, z) positions of
+              the node, in the same order as get_positions()."""
+  nodes = numpy.asarray(schematic.data["node"])
+  # argwhere lists the positions in the x, y, z order of the loops.
+  positions = numpy.argwhere(numpy.isin(nodes, ids))
+  found = nodes[tuple(positions.T)]
+  return {schematic.nodes[id]: positions[found == id] for id in ids}
+
+
 def get_positions(schematic, ids: list):
+  if numpy:
+    arrays = get_position_arrays(schematic, ids)
+    return {name: list(map(tuple, a.tolist())) for name,a in arrays.items()}
+
   positions = {schematic.nodes[id]: [] for id in ids}
   for x, xd in enumerate(schematic.data["node"]):
     for y, yd in enumerate(xd):
@@ -33,6 +61,12 @@ def mts_to_game(x, y, z):
   return (x-100, y-100, z-100)
 
 def get_block_positions(schematic, name):
+  if numpy:
+    positions = get_position_arrays(schematic, [schematic.nodes.index(name)])[name]
+    # mts_to_game works on whole columns as well.
+    positions = numpy.column_stack(mts_to_game(*positions.T))
+    return list(map(tuple, positions.tolist()))
+
   positions = get_positions(schematic, [schematic.nodes.index(name)])[name]
   return [mts_to_game(*pos) for pos in positions]
 
@@ -44,34 +78,27 @@ def dist(p0, p1):
   return math.sqrt(dx**2+dy**2+dz**2)
 
 def find(pos, radius):
+  # The grids are spatial.Grid instances of the block positions.
   print("Gold: ")
-  for block_pos in gold_positions:
-    if dist(pos, block_pos) < radius:
-      print(block_pos)
+  for _,i in gold_grid.withinRadius(pos, radius, strict=True):
+    print(gold_grid.points[i])
   print("\nDiamond: ")
-  for block_pos in dia_positions:
-    if dist(pos, block_pos) < radius:
-      print(block_pos)
+  for _,i in dia_grid.withinRadius(pos, radius, strict=True):
+    print(dia_grid.points[i])
   print("\nMese: ")
-  for block_pos in mese_positions:
-    if dist(pos, block_pos) < radius:
-      print(block_pos)
+  for _,i in mese_grid.withinRadius(pos, radius, strict=True):
+    print(mese_grid.points[i])
 
 
 def score(pos):
   #positions = {
-  #  gold_positions: 1,
-  #  dia_positions: 0,
-  #  mese_positions: 0
+  #  gold_grid: 1,
+  #  dia_grid: 0,
+  #  mese_grid: 0
   #}
-  score = 0
   #for collection,weight in positions.items():
-  for block_pos in dirt_positions:
-    if block_pos[0] == pos[0] and block_pos[1] == pos[1] and block_pos[2] == pos[2]:
-      continue
-    if dist(block_pos, pos) < 5:
-      score += 1
-  return score
+  # Blocks at a squared distance of 0 are the block at pos itself.
+  return sum(1 for d2,_ in dirt_grid.withinRadius(pos, 5, strict=True) if d2)
 
 
 
@@ -80,7 +107,11 @@ if __name__ == "__main__":
   connection = database.connect(config)
   database.setupOutback(connection)
 
-  schematic = mtschem.Schem("musttest_game/mods/rc/outback_map.mts")
+  schematicPath = "musttest_game/mods/rc/outback_map.mts"
+  if numpy:
+    schematic = schemcache.Schem(schematicPath)
+  else:
+    schematic = mtschem.Schem(schematicPath)
   stats = count_blocks(schematic)
   query = "INSERT INTO outback VALUES (DEFAULT, ?, ?);"
   cursor = connection.cursor()
@@ -95,6 +126,10 @@ if __name__ == "__main__":
   #mese_positions = get_block_positions(schematic, "rackstone:rackstone_with_mese")
   #iron_positions = get_block_positions(schematic, "rackstone:rackstone_with_iron")
   #dirt_positions = get_block_positions(schematic, "default:dirt")
+  #gold_grid = spatial.Grid(gold_positions, 8)
+  #dia_grid = spatial.Grid(dia_positions, 8)
+  #mese_grid = spatial.Grid(mese_positions, 8)
+  #dirt_grid = spatial.Grid(dirt_positions, 5)
   #print(gold_positions)
   scores = {}
   # for pos in dirt_positions:
@@ -1,304 +1,179 @@
 #!/usr/bin/env python3
-import os
 import re
 import time
-import mariadb
 import datetime
 import database
+import argparse
+import analytics
+import chatlog
+import checkpoint
 import configmanager
+import grammar
+import profiler
+import sessionindex
 from tqdm import tqdm
 from helpers import *
 
-from mobmessages import kill_ang
 
-# Date format switch happened on 2017-07-05
-dateRegexNew = r"^\[(\d{4})/(\d{2})/(\d{2}), (\d{2}):(\d{2}):(\d{2}) UTC\][ ]*"
-serverMsgPrefix = "^# Server: "
-regexNameWithMark = (
-  "<(!)?(.*?)"         # Then, capture the user name; optional ! in case of shouting: "<!boxface"
-  r"( \["              # Open a new group in case the player is marked, with coordinates show in brackets: " ["
-  "(.*?: ?)?"          # If this is the case, the realm comes next: "Caverns: "
-                       # But realms were missing at the beginning of the servers life, so this is also an optional group!
-                       # Also, there are three cases were the space after the colon is missing -_- (as of 2022-11-19)
-  r"-?\d*,-?\d*,-?\d*" # The coordinates follow, minus sign is optional: "1059,-5791,-8929"
-  r"\])?"              # Close the group for the player marking and make it optional: "]"
-  "!?>"                # And the closing chevron with optional shouting finally ending this: "!>")
-)
 
+def analyzeMapgen(data: dict, res: re.Match, timestamp: datetime.datetime):
+  players = data["players"]
+  chunkGenerations = data["chunkGenerations"]
+  date = timestamp.date()
 
+  g = res.groups()
+  name = g[0]
+  chunks = int(g[1])
+  ensurePlayer(players, name, timestamp)
+  players[name].nChunks += chunks
 
-def analyzeMapgen(data: dict, l: str, timestamp: datetime.datetime):
-  players = data["players"]
+  updateLastSeen(players[name], timestamp)
+  if not chunkGenerations.get(date):
+    chunkGenerations[date] = 0
+  chunkGenerations[date] += chunks
+
+
+def analyzeAnonMapgen(data: dict, res: re.Match, timestamp: datetime.datetime):
   chunkGenerations = data["chunkGenerations"]
   date = timestamp.date()
 
-  regexBlame = serverMsgPrefix + r"Mapgen scrambling\. Blame <(.*?)> for lag. Chunks: (\d*)\.$"
-  res = re.search(regexBlame, l)
-  if res:
-    g = res.groups()
-    name = g[0]
-    chunks = int(g[1])
-    ensurePlayer(players, name, timestamp)
-    players[name]["nChunks"] += chunks
-
-    updateLastSeen(players[name], timestamp)
-    if not chunkGenerations.get(date):
-      chunkGenerations[date] = 0
-    chunkGenerations[date] += chunks
-    return True
-
-  regexAnon = serverMsgPrefix + r"Mapgen working, expect lag\. \(Chunks: (\d*)\.\)$"
-  res = re.search(regexAnon, l)
-  if res:
-    chunks = int(res.groups()[0])
-    if not chunkGenerations.get(date):
-      chunkGenerations[date] = 0
-    chunkGenerations[date] += chunks
-    return True
-
-  return False
-
-
-def analyzeLogins(data: dict, l: str, timestamp: datetime.datetime):
-  players = data["players"]
-  joinString = r"^\*{3} <(.*?)> joined the game\.$"
-  # The quit string regex does not have a $ at the end, because an
-  # additional comment in parenthesis may follow.
-  quitString = r"^\*{3} <(.*?)> left the game\."
-
-  res = re.search(joinString, l)
-  if res:
-    name = res.groups()[0]
-    startSession(data, name, timestamp)
-    return True
-
-  res = re.search(quitString, l)
-  if res:
-    name = res.groups()[0]
-    endSession(data, name, timestamp)
-    return True
-
-  return False
-
-
-def analyzeChatMessages(data: dict, l: str, timestamp: datetime.datetime):
-  # Get all lines that start with a username surrounded by chevrons (< and >),
-  # i.e. all user messages in public chat.
-  # Example with all optional groups present:
-  # <!boxface [Caverns: 1059,-5791,-8929]!> HELP
-  # Example without realm:
-  # <J2 [-232,-4,1]> hello?
-  players = data["players"]
+  chunks = int(res.groups()[0])
+  if not chunkGenerations.get(date):
+    chunkGenerations[date] = 0
+  chunkGenerations[date] += chunks
 
-  res = re.search("^" + regexNameWithMark, l)
-  if not res:
-    return False
+
+def analyzeJoins(data: dict, res: re.Match, timestamp: datetime.datetime):
+  name = res.groups()[0]
+  startSession(data, name, timestamp)
+
+
+def analyzeQuits(data: dict, res: re.Match, timestamp: datetime.datetime):
+  name = res.groups()[0]
+  endSession(data, name, timestamp)
+
+
+def analyzeChatMessages(data: dict, res: re.Match, timestamp: datetime.datetime):
+  players = data["players"]
   name = res.groups()[1]
   ensurePlayer(players, name, timestamp)
   updateLastSeen(players[name], timestamp)
-  players[name]["nMsg"] += 1
+  players[name].nMsg += 1
   if res.groups()[0] == "!":
-    players[name]["nShouts"] += 1
-  return True
+    players[name].nShouts += 1
 
 
-def analyzePlanes(data: dict, l: str, timestamp: datetime.datetime):
-  # Server: <Nakilashiva> has plane shifted to Overworld.
-  # Server: <dunks> has plane shifted to Outback. Noob!
+def analyzePlanes(data: dict, res: re.Match, timestamp: datetime.datetime):
   players = data["players"]
-  regex = serverMsgPrefix + r"<(.*?)> has plane shifted to (.*?)\.$"
-
-  res = re.search(regex, l)
-  if not res:
-    return False
   name, plane = res.groups()
   ensurePlayer(players, name, timestamp)
-  if not plane in players[name]["planes"]:
-    players[name]["planes"].append(plane)
-  return True
+  if not plane in players[name].planes:
+    players[name].planes.append(plane)
 
 
-def analyzeSuicides(data: dict, l: str, timestamp: datetime.datetime):
+def analyzeSuicides(data: dict, res: re.Match, timestamp: datetime.datetime):
   players = data["players"]
-  regex = serverMsgPrefix + "<(.*?)> ended (her|him)self.$"
-  res = re.search(regex, l)
-  if not res:
-    return False
   name = res.groups()[0]
   ensurePlayer(players, name, timestamp)
-  players[name]["nSuicides"] += 1
-  return True
+  players[name].nSuicides += 1
 
 
-re_ang = "|".join(kill_ang)
-mobRegex = serverMsgPrefix + f"(<.*?>|An explorer) was .*? by an? ({re_ang})? ?(.*?)\\.$"
-def analyzeDeathByMob(data: dict, l: str, timestamp: datetime.datetime):
-  # "# Server: " .. victim .. " was " .. adv .. adj .. " by " .. an .. " " .. ang .. mname .. "."
-  res = re.search(mobRegex, l)
-  if not res:
-    return False
+def analyzeDeathByMob(data: dict, res: re.Match, timestamp: datetime.datetime):
+  victim = res.groups()[0]
   mob = res.groups()[-1]
   if not data["deathbymob"].get(mob):
     data["deathbymob"][mob] = 1
+    data["mobIds"][mob] = len(data["mobIds"])
   else:
     data["deathbymob"][mob] += 1
-  return True
+
+  # Anonymous deaths are only counted per mob.
+  if victim.startswith("<"):
+    name = victim[1:-1]
+    ensurePlayer(data["players"], name, timestamp)
+    mobDeaths = data["players"][name].mobDeaths
+    mobId = data["mobIds"][mob]
+    if mobId >= len(mobDeaths):
+      mobDeaths.extend([0] * (mobId + 1 - len(mobDeaths)))
+    mobDeaths[mobId] += 1
 
 
-def analyzeCleanups(data: dict, l: str, timestamp: datetime.datetime):
-  # [2025/11/16, 07:00:04 UTC]    # Server: Accounts have been hoovered. 1660 chars kept. Go save a stork.
-  regex = serverMsgPrefix + r"Accounts have been hoovered\. (\d*) chars kept\."
-  res = re.search(regex, l)
-  if not res:
-    return False
+def analyzeCleanups(data: dict, res: re.Match, timestamp: datetime.datetime):
   data["cleanups"].append({
     "timestamp": timestamp,
     "n": res.groups()[0]
   })
-  return True
 
 
-def analyzeRenames(data: dict, l: str, timestamp: datetime.datetime):
-  # [2022/08/29, 14:55:44 UTC]    # Server: Player <DragonsVolcanoDance> is reidentified as <GordanRamsey>!
-  # [2019/03/31, 19:58:46 UTC]    # Server: Player <wannabe> renamed to <MustTest>!
-  regex = serverMsgPrefix + r"Player <([^<>]*)> (renamed to|is reidentified as) <([^<>]*)>"
-  res = re.search(regex, l)
-  if not res:
-    return False
+def analyzeRenames(data: dict, res: re.Match, timestamp: datetime.datetime):
   from_name = res.groups()[0]
   to_name = res.groups()[2]
 
   endSession(data, from_name, timestamp)
   startSession(data, to_name, timestamp)
-  return True
 
 
-def analyzeKicks(data: dict, l: str, timestamp: datetime.datetime):
-  # [2023/03/17, 00:39:01 UTC]    # Server: <Cucina> was kicked for being AFK too long.
-  # [2023/03/17, 00:49:42 UTC]    # Server: <Jr> was kicked off the server.
-  regex = serverMsgPrefix + r"<(.*?)> was kicked"
-  if not (res := re.search(regex, l)):
-    return False
+def analyzeKicks(data: dict, res: re.Match, timestamp: datetime.datetime):
   name = res.groups()[0]
   if not data["players"].get(name):
     #print(f"WEIRD: {name} was kicked without ever logging in")
-    return True
-  data["players"][name]["nKicks"] += 1
-  return True
+    return
+  data["players"][name].nKicks += 1
 
 
-def analyzeDuctTapes(data: dict, l: str, timestamp: datetime.datetime):
-  # [2025/11/22, 18:11:31 UTC]    # Server: Player <Q>'s chat has been duct-taped!
-  regex = serverMsgPrefix + r"Player <(.*?)>'s chat has been duct-taped"
-  if not (res := re.search(regex, l)):
-    return False
+def analyzeDuctTapes(data: dict, res: re.Match, timestamp: datetime.datetime):
   name = res.groups()[0]
-  data["players"][name]["nDuctTapes"] += 1
-  return True
+  data["players"][name].nDuctTapes += 1
 
 
-def analyzeMes(data: dict, l: str, timestamp: datetime.datetime):
-  # * <DragonsVolcanoDance> gives hamburger
-  # * <Alex [-386,-6,412]> coughs
-  regex = r"^\* " + regexNameWithMark
-  if not (res := re.search(regex, l)):
-    return False
+def analyzeMes(data: dict, res: re.Match, timestamp: datetime.datetime):
   name = res.groups()[1]
   ensurePlayer(data["players"], name, timestamp)
-  data["players"][name]["nMes"] += 1
-  data["players"][name]["nMsg"] += 1
-  return True
+  data["players"][name].nMes += 1
+  data["players"][name].nMsg += 1
 
 
-def analyzeMarks(data: dict, l: str, timestamp: datetime.datetime):
-  # Server: Player <linux> has been marked!
-  regex = serverMsgPrefix + r"Player <(.*?)> has been marked!"
-  if not (res := re.search(regex, l)):
-    return False
+def analyzeMarks(data: dict, res: re.Match, timestamp: datetime.datetime):
   name = res.groups()[0]
-  data["players"][name]["nMarks"] += 1
-  return True
+  data["players"][name].nMarks += 1
 
 
-def parseShutdowns(data: dict, l: str, timestamp: datetime.datetime):
-  # Server: Startup complete.
-  # Server: Exited without signal. If this is a normal failure the server will restart in a few seconds.
-  regex_shutdown = serverMsgPrefix + "(Startup complete|Normal shutdown|Exited without signal)"
-
-  if not (res := re.search(regex_shutdown, l)):
-    return False
-
+def parseShutdowns(data: dict, res: re.Match, timestamp: datetime.datetime):
   # Terminate all player sessions.
   for name in data["activeSessions"]:
     p = data["players"][name]
-    if p["sessions"][-1]["end"] != None:
+    if p.sessionEnds[-1] != sessionOpen:
       continue
-    p["sessions"][-1]["end"] = timestamp
+    p.sessionEnds[-1] = int(timestamp.timestamp())
   data["activeSessions"] = []
-  return True
 
 
-def printLine(data: dict, l: str, timestamp: datetime.datetime):
-  print(l.rstrip("\n"))
-  return False
+def printLine(data: dict, res: re.Match, timestamp: datetime.datetime):
+  print(res.string.rstrip("\n"))
 
 
 def sumTotalTime(players: dict):
   for name,p in players.items():
-    totalTime = datetime.timedelta()
-    for s in p["sessions"]:
-      if s["start"] == None or s["end"] == None:
-        continue
-      p["totalTime"] += s["end"] - s["start"]
+    p.totalTime = sum(end - start for start,end in p.sessions() if end != sessionOpen)
 
 
 def checkSessions(players: dict):
   n_issues = 0
   for name,p in players.items():
-    for i,s in enumerate(p["sessions"]):
-      valid = True
-      if s["start"] == None:
-        #print(f"Session {i} of player '{name}' does not have a start.")
-        n_issues += 1
-        valid = False
-      if s["end"] == None:
+    for i,(start,end) in enumerate(p.sessions()):
+      if end == sessionOpen:
         #print(f"Session {i} of player '{name}' does not have an end.")
         n_issues += 1
-        valid = False
-      if s["start"] == None and s["end"] == None:
-        print("Both start and end of '{player}'\'s session {i} are None.")
-      if not valid:
         continue
-      dt = s["end"] - s["start"]
-      if dt.total_seconds() > 3600*24:
-        print(f"Session {i} of player '{name}' is longer than one day. ({dt})")
+      if end - start > 3600*24:
+        print(f"Session {i} of player '{name}' is longer than one day. ({datetime.timedelta(seconds=end - start)})")
         n_issues += 1
   print(f"Session issues: {n_issues}")
 
 
-def plot_session_probability(player: str, t_step: int, days=7*4*3):
-  T = list(range(0, 24*3600, t_step))
-  P = [0]*len(T)
-  import math
-  for s in data["players"][player]["sessions"]:
-    if datetime.datetime.now(datetime.UTC) - s["start"] > datetime.timedelta(days=days):
-      continue
-    if s["end"] == None:
-      continue
-    dt = datetime.timedelta(seconds=t_step)
-    # Go to first point in time within the session rounded to multiples of t_step.
-    t = s["start"]
-    seconds = t.minute*60+t.second
-    t -= datetime.timedelta(seconds=seconds)
-    t += datetime.timedelta(seconds=t_step*math.ceil(seconds/t_step))
-    # Step through session with t_step and sample.
-    while t >= s["start"] and t <= s["end"]:
-      seconds = t.hour*3600 + t.minute*60 + t.second
-      P[round(seconds/t_step)] += 1
-      t += dt
-
-  # Normalize counted samples to total days within analyzed time period.
-  P = [p/days*100 for p in P]
+def plot_session_probability(player: Player, t_step: int, days=7*4*3):
+  T, P = analytics.onlineProbability([player], t_step, days)
+  P = P[0]
 
   import matplotlib.pyplot as plt
   fig,ax = plt.subplots()
@@ -310,36 +185,21 @@ def plot_session_probability(player: str, t_step: int, days=7*4*3):
   plt.show()
 
 
-def calc_daily_playtime(player: dict):
-  player["activity"] = {"dates": [], "playtimes": []}
-  #player["activity"]["playtimes"] = [0]*len(player["activity"]["dates"])
-  for s in player["sessions"]:
-    if s["start"] == None or s["end"] == None:
-      continue
-    dt = s["end"] - s["start"]
-    date = s["start"].date()
-    try:
-      i = player["activity"]["dates"].index(date)
-    except ValueError:
-      i = len(player["activity"]["dates"])
-      player["activity"]["dates"].append(date)
-      player["activity"]["playtimes"].append(0)
-    player["activity"]["playtimes"][i] += dt.total_seconds() / 3600
+def calc_daily_playtime(player: Player):
+  # Sessions crossing midnight are split between both days.
+  playtimes = analytics.dailyPlaytime(player)
+  return {"dates": list(playtimes), "playtimes": [s / 3600 for s in playtimes.values()]}
 
 
-def plot_activity_graph(player: dict):
+def plot_activity_graph(activity: dict):
+  playtimes = dict(zip(activity["dates"], activity["playtimes"]))
   dates = []
-  playtimes = []
   date = datetime.date(2017, 7, 3)
   today = datetime.datetime.now(datetime.UTC).date()
   while date <= today:
     dates.append(date)
-    try:
-      i = player["activity"]["dates"].index(date)
-      playtimes.append(player["activity"]["playtimes"][i])
-    except ValueError:
-      playtimes.append(0)
     date += datetime.timedelta(days=1)
+  playtimes = [playtimes.get(date, 0) for date in dates]
 
   import matplotlib.pyplot as plt
   plt.rcParams.update({"figure.figsize": (13, 6.5), "figure.dpi": 100})
@@ -351,106 +211,435 @@ def plot_activity_graph(player: dict):
   plt.show()
 
 
-
-if __name__ == "__main__":
-  config = configmanager.readConfig()
-  connection = database.connect(config)
-  database.setup(connection)
-
-  files = sorted(os.listdir(config["chatlogDir"]))
-  files = [config["chatlogDir"] + f for f in files]
-  data = {
+def createData():
+  return {
     "players": {},
     "deathbymob": {},
+    # Interned mob names, the id is the index into Player.mobDeaths.
+    "mobIds": {},
     "cleanups": [],
     "chunkGenerations": {},
     "print": False,
     "activeSessions": [],
+    # Values as they were last written to the database, see saveResults().
+    "saved": {
+      "players": {},
+      "sessions": {},
+      "chunkGenerations": {},
+      "deathbymob": {},
+      "mobDeaths": {},
+      "nCleanups": 0,
+      # Number of saves, recorded in the meta table along with each save.
+      "nSaves": 0,
+    },
   }
 
+
+playerColumns = ["id", "name", "firstSeen", "lastSeen", "totalTime", "nLogins", "nMessages",
+                 "nSuicides", "chunks", "nDuctTapes", "nKicks", "nMarks", "nShouts", "nMes", "planes"]
+
+def playerRow(player: Player):
+  return (
+    player.firstSeen,
+    player.lastSeen,
+    player.totalTime,
+    player.nLogins,
+    player.nMsg,
+    player.nSuicides,
+    player.nChunks,
+    player.nDuctTapes,
+    player.nKicks,
+    player.nMarks,
+    player.nShouts,
+    player.nMes,
+    ", ".join(player.planes)
+  )
+
+
+def newSessionRows(data: dict):
+  """Yields the sessions that ended since the last save as database rows.
+
+  Sessions are only ever appended and only the last session of a
+  player may still be running, so everything before the first session
+  that hasn't been written yet can be skipped. data["saved"] is updated
+  while iterating.
+  """
+  saved = data["saved"]
+  for name,player in tqdm(data["players"].items(), desc="Session analysis"):
+    first = saved["sessions"].get(name, 0)
+    ends = player.sessionEnds
+    for start,end in zip(player.sessionStarts[first:], ends[first:]):
+      if end == sessionOpen:
+        continue
+      yield (player.sqlId, datetimeFromEpoch(start), datetimeFromEpoch(end))
+    if ends and ends[-1] == sessionOpen:
+      saved["sessions"][name] = len(ends) - 1
+    else:
+      saved["sessions"][name] = len(ends)
+
+
+def unsavedSessions(data: dict):
+  """Yields (player, start, end) of the sessions that ended since the
+  last save, without marking them as saved like newSessionRows().
+  """
+  saved = data["saved"]
+  for name,player in data["players"].items():
+    first = saved["sessions"].get(name, 0)
+    for start,end in zip(player.sessionStarts[first:], player.sessionEnds[first:]):
+      if end != sessionOpen:
+        yield player, start, end
+
+
+def saveResults(connection, data: dict, suffix: str = "", chunkSize: int = 10000,
+                loadDataInfile: bool = False):
+  """Write the analysis results to the database.
+
+  Only rows that changed since the last call are written. What has been
+  written is remembered in data["saved"], which is part of the checkpoint,
+  so on a freshly set up database all rows are inserted. New rows are
+  inserted in bulk, see database.bulkInsert().
+
+  :param suffix: Suffix of the table names, used to write into staging tables.
+  """
+  saved = data["saved"]
+  cursor = connection.cursor()
+  bulkOptions = {"chunkSize": chunkSize, "loadDataInfile": loadDataInfile}
+
+  newRows = []
+  updates = []
+  for i,(name,player) in enumerate(data["players"].items(), start=1):
+    player.sqlId = i
+    row = playerRow(player)
+    if name not in saved["players"]:
+      newRows.append((i, name, *row))
+    elif saved["players"][name] != row:
+      updates.append((*row, i))
+    saved["players"][name] = row
+  # Names that are equal in the table's collation are skipped.
+  database.bulkInsert(connection, "players" + suffix, playerColumns, newRows, ignore=True, **bulkOptions)
+  if updates:
+    query = f"""UPDATE players{suffix} SET firstSeen = ?, lastSeen = ?, totalTime = ?,
+      nLogins = ?, nMessages = ?, nSuicides = ?, chunks = ?, nDuctTapes = ?, nKicks = ?,
+      nMarks = ?, nShouts = ?, nMes = ?, planes = ? WHERE id = ?;"""
+    cursor.executemany(query, updates)
+
+  # Committed in the same transaction as the rest, so a checkpoint can be
+  # checked against the database, see database.savedCount().
+  saved["nSaves"] += 1
+  query = f"INSERT INTO meta{suffix} VALUES (DEFAULT, UTC_TIME(), ?);"
+  cursor.execute(query, (saved["nSaves"],))
+
+  newRows = [(c["timestamp"], c["n"]) for c in data["cleanups"][saved["nCleanups"]:]]
+  database.bulkInsert(connection, "accountCleanups" + suffix, ["timestamp", "accountsKept"], newRows, **bulkOptions)
+  saved["nCleanups"] = len(data["cleanups"])
+
+  newRows = []
+  updates = []
+  for timestamp,count in data["chunkGenerations"].items():
+    if timestamp not in saved["chunkGenerations"]:
+      newRows.append((timestamp, count))
+    elif saved["chunkGenerations"][timestamp] != count:
+      updates.append((count, timestamp))
+    saved["chunkGenerations"][timestamp] = count
+  database.bulkInsert(connection, "chunkGenerations" + suffix, ["timestamp", "count"], newRows, **bulkOptions)
+  if updates:
+    cursor.executemany(f"UPDATE chunkGenerations{suffix} SET count = ? WHERE timestamp = ?;", updates)
+
+  newRows = []
+  updates = []
+  for name,count in data["deathbymob"].items():
+    if name not in saved["deathbymob"]:
+      newRows.append((data["mobIds"][name] + 1, name, count))
+    elif saved["deathbymob"][name] != count:
+      updates.append((count, name))
+    saved["deathbymob"][name] = count
+  database.bulkInsert(connection, "mobs" + suffix, ["id", "name", "nDeaths"], newRows, **bulkOptions)
+  if updates:
+    cursor.executemany(f"UPDATE mobs{suffix} SET nDeaths = ? WHERE name = ?;", updates)
+
+  # Only counts that changed since the last save are written, counts
+  # that were 0 before are new rows.
+  newRows = []
+  updates = []
+  for name,player in data["players"].items():
+    mobDeaths = player.mobDeaths
+    savedDeaths = saved["mobDeaths"].get(name, ())
+    if not mobDeaths or mobDeaths == savedDeaths:
+      continue
+    for mobId,count in enumerate(mobDeaths):
+      savedCount = savedDeaths[mobId] if mobId < len(savedDeaths) else 0
+      if count == savedCount:
+        continue
+      if savedCount == 0:
+        newRows.append((player.sqlId, mobId + 1, count))
+      else:
+        updates.append((count, player.sqlId, mobId + 1))
+    saved["mobDeaths"][name] = mobDeaths[:]
+  # The primary key can't be violated, see above.
+  database.bulkInsert(connection, "playerMobDeaths" + suffix, ["playerId", "mobId", "nDeaths"], newRows,
+                      deferChecks=True, **bulkOptions)
+  if updates:
+    cursor.executemany(f"UPDATE playerMobDeaths{suffix} SET nDeaths = ? WHERE playerId = ? AND mobId = ?;",
+                       updates)
+
+  # The concurrency only changes from the earliest new session on, the
+  # rows from then on are replaced.
+  since = min((start for _,start,_ in unsavedSessions(data)), default=None)
+  if since is not None:
+    minuteRows, dayRows = analytics.concurrency(data["players"].values(), since)
+    cursor.execute(f"DELETE FROM concurrency{suffix} WHERE timestamp >= ?;",
+                   (datetimeFromEpoch(since // 60 * 60),))
+    database.bulkInsert(connection, "concurrency" + suffix, ["timestamp", "nOnline"],
+                        ((datetimeFromEpoch(minute), n) for minute,n in minuteRows), **bulkOptions)
+    cursor.execute(f"DELETE FROM dailyPeaks{suffix} WHERE date >= ?;", (analytics.dayOf(since),))
+    database.bulkInsert(connection, "dailyPeaks" + suffix, ["date", "peak", "peakTime"],
+                        ((analytics.epoch + datetime.timedelta(days=day), peak, datetimeFromEpoch(peakTime))
+                         for day,peak,peakTime in dayRows), **bulkOptions)
+
+  # A row per hour a session overlaps, see sessionindex.py. The table
+  # has no unique keys.
+  newRows = ((player.sqlId, bucket, datetimeFromEpoch(start), datetimeFromEpoch(end))
+             for player,start,end in unsavedSessions(data)
+             for bucket in sessionindex.bucketsOf(start, end))
+  database.bulkInsert(connection, "sessionBuckets" + suffix, ["playerId", "bucket", "start", "end"], newRows,
+                      deferChecks=True, **bulkOptions)
+
+  # The only unique key of sessions is its AUTO_INCREMENT id, so the
+  # checks can safely wait until all sessions are loaded.
+  database.bulkInsert(connection, "sessions" + suffix, ["playerId", "start", "end"], newSessionRows(data),
+                      deferChecks=True, **bulkOptions)
+
+  # Sessions that are still running, rewritten as a whole. A player who
+  # joined twice without quitting is listed twice in activeSessions.
+  players = data["players"]
+  cursor.execute(f"DELETE FROM onlinePlayers{suffix};")
+  newRows = [(players[name].sqlId, datetimeFromEpoch(players[name].sessionStarts[-1]))
+             for name in dict.fromkeys(data["activeSessions"]) if players[name].sessionEnds[-1] == sessionOpen]
+  database.bulkInsert(connection, "onlinePlayers" + suffix, ["playerId", "since"], newRows, **bulkOptions)
+
+
+
+analyzers = [
+  (analyzeChatMessages, grammar.chatMessage),
+  (analyzeJoins, grammar.join),
+  (analyzeQuits, grammar.quit),
+  (analyzeMapgen, grammar.mapgenBlame),
+  (analyzeAnonMapgen, grammar.mapgenAnon),
+  (analyzePlanes, grammar.planeShift),
+  (analyzeDeathByMob, grammar.deathByMob),
+  (parseShutdowns, grammar.shutdown),
+  (analyzeKicks, grammar.kick),
+  (analyzeMes, grammar.me),
+  (analyzeDuctTapes, grammar.ductTape),
+  (analyzeMarks, grammar.mark),
+  (analyzeRenames, grammar.rename),
+  (analyzeSuicides, grammar.suicide),
+  (analyzeCleanups, grammar.cleanup),
+]
+
+# The dispatcher tries the regexes of all analyzers sharing the first
+# character of a line in list order, within a single regex scan.
+# Frequent matches should still come first and more specific regexes
+# must precede more general ones (death by mob before kicks).
+dispatcher = grammar.Dispatcher(analyzers)
+
+
+def readChatlog(fileDate: datetime.date, fileName: str, skip: int = 0):
+  """Yields the timestamp and message body of every line of a chatlog file.
+
+  :param skip: Number of lines to skip, which were analyzed by live.py already.
+  """
+  # Skip messages that end up in the wrong file because
+  # someone pasted an old timestamp into the server chat.
+  # (I'm looking at you Mango and SD!)
+  # Comparing the date as text is cheaper than decoding it first.
+  prefix = fileDate.strftime("[%Y/%m/%d, ")
+  decoder = grammar.TimestampDecoder()
+  with chatlog.openDay(fileName) as f:
+    for l in f:
+      if not l.startswith(prefix):
+        continue
+      timestamp, l = decoder.decode(l)
+      if timestamp:
+        if skip:
+          skip -= 1
+          continue
+        yield timestamp, l
+
+
+def parseFile(file: tuple):
+  """Matches all lines of a chatlog file without analyzing them.
+
+  This is the part of the analysis that runs in worker processes. Sessions,
+  renames and shutdowns depend on everything that happened before, so the
+  handlers are called later on by replayFile(), one file after another.
+
+  Lines that live.py analyzed already are matched as well, so they can
+  be exported, but must not be replayed.
+
+  :param file: Tuple of the arguments of readChatlog().
+  :return: List of (analyzer index, timestamp, groups) tuples and the
+           number of them that live.py analyzed already.
+  """
+  fileDate, fileName, *skip = file
+  skip = skip[0] if skip else 0
+  events = []
+  nSkipped = 0
+  for n,(timestamp,l) in enumerate(readChatlog(fileDate, fileName)):
+    i, res = dispatcher.match(l)
+    if i >= 0:
+      events.append((i, timestamp, res.groups()))
+      if n < skip:
+        nSkipped += 1
+  return events, nSkipped
+
+
+def replayFile(data: dict, events: list, matches: list):
+  for i,timestamp,groups in events:
+    analyzers[i][0](data, grammar.ReplayMatch(groups), timestamp)
+    matches[i] += 1
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Analyze the chatlog archive and save the statistics to the database.")
+  parser.add_argument("--incremental", action="store_true",
+                      help="Resume from the last checkpoint and only analyze chatlog files added since.")
+  parser.add_argument("-j", "--jobs", type=int, default=1,
+                      help="Number of processes parsing chatlog files, 0 for one per CPU core.")
+  parser.add_argument("--profile", nargs="?", const="profile.json", metavar="REPORT",
+                      help="Measure every analyzer and write a JSON report (default: profile.json). "
+                           "Implies --jobs 1.")
+  parser.add_argument("--suggest-order", action="store_true",
+                      help="With --profile, suggest the fastest order of the analyzers.")
+  parser.add_argument("--export-events", action="store_true",
+                      help="Also write every recognized event to monthly columnar files, see eventstore.py. "
+                           "Needs NumPy.")
+  args = parser.parse_args()
+  if args.profile and args.jobs != 1:
+    print("Profiling parses all files in this process, ignoring --jobs.")
+    args.jobs = 1
+  if args.profile and args.export_events:
+    print("Profiling dispatches lines without keeping their matches, ignoring --export-events.")
+    args.export_events = False
+
+  config = configmanager.readConfig()
+  connection = database.connect(config)
+  checkpointPath = config.get("checkpoint", "checkpoint.pickle")
+  # Held until the end of the run.
+  checkpointLock = checkpoint.lock(checkpointPath)
+  if not checkpointLock:
+    print(f"Checkpoint '{checkpointPath}' is in use, e.g. by live.py, stopping.")
+    exit(checkpoint.lockedExitCode)
+
+  # A full analysis is loaded into staging tables, so the current tables
+  # stay available until the new ones are complete.
+  resumed = checkpoint.load(checkpointPath) if args.incremental else None
+  # A run interrupted between committing to the database and saving the
+  # checkpoint leaves a checkpoint behind that would write rows again.
+  if resumed and resumed[1]["saved"]["nSaves"] != database.savedCount(connection):
+    print(f"Checkpoint '{checkpointPath}' doesn't match the database, analyzing everything.")
+    resumed = None
+  if resumed:
+    lastDate, data = resumed
+    suffix = ""
+  else:
+    lastDate = None
+    data = createData()
+    # Keep counting, so an old checkpoint never matches the new tables.
+    data["saved"]["nSaves"] = database.savedCount(connection) or 0
+    suffix = "_new"
+    database.setup(connection, suffix)
+
+  # Part of the next day may have been analyzed by live.py already.
+  live = data.get("live")
+  files = []
+  for fileDate,fileName in chatlog.listDays(config["chatlogDir"]):
+    if lastDate and fileDate <= lastDate:
+      continue
+    # Days are downloaded in parallel, so a failed download can leave a
+    # gap. Resuming behind it would skip the missing day for good.
+    if lastDate and fileDate != lastDate + datetime.timedelta(days=len(files) + 1):
+      print(f"Chatlog of {lastDate + datetime.timedelta(days=len(files) + 1)} is missing, stopping there.")
+      break
+    if live and live["date"] == fileDate:
+      files.append((fileDate, fileName, live["lines"]))
+    else:
+      files.append((fileDate, fileName))
+
+  eventStore = None
+  if args.export_events:
+    try:
+      import eventstore
+    except ImportError:
+      print("Exporting events needs NumPy.")
+      exit()
+    since = ((lastDate - analytics.epoch).days + 1) * analytics.secondsPerDay if lastDate else None
+    patternNames = {pattern: name for name,pattern in grammar.patterns.items()}
+    eventStore = eventstore.EventStore(config.get("eventDir", "events"),
+                                       [patternNames[pattern] for _,pattern in analyzers], since)
+
   import time
   start = time.time()
 
-  # For every line in the chatlog, the analyzers are called one after
-  # another until one returns True, signaling that its regex matched
-  # and no further parsing is necessary. The most frequent matches
-  # should therefore be at the beginning of the list. (-> performance)
-  analyzers = [analyzeChatMessages, analyzeLogins, analyzeMapgen, analyzePlanes, analyzeDeathByMob, parseShutdowns, analyzeKicks, analyzeMes, analyzeDuctTapes, analyzeMarks, analyzeRenames, analyzeSuicides, analyzeCleanups]
   matches = [0] * len(analyzers)
-  for fileName in tqdm(files, desc="Parsing chatlog"):
-    with open(fileName) as f:
-      fileDate = datetime.date(*[int(n) for n in fileName.split("/")[-1].split("-")])
-      for l in f:
-        if not (res := re.search(dateRegexNew, l)):
-          continue
-        timestamp = datetimeFromRegex(res.groups())
-        if not timestamp.date() == fileDate:
-          # Skip messages that end up in the wrong file because
-          # someone pasted an old timestamp into the server chat.
-          # (I'm looking at you Mango and SD!)
-          continue
-        l = l[30:] # This fails at [2017/07/05, 22:17:40 UTC]
-        for i,analyzer in enumerate(analyzers):
-          if analyzer(data, l, timestamp):
-            matches[i] += 1
-            break
+  if args.profile:
+    # Same as the serial run below, but every line is dispatched by the
+    # profiler and every file is timed.
+    prof = profiler.Profiler(dispatcher)
+    for file in tqdm(files, desc="Profiling chatlog"):
+      fileStart = time.perf_counter()
+      nLines = 0
+      for timestamp,l in readChatlog(*file):
+        i = prof.dispatch(data, l, timestamp)
+        if i >= 0:
+          matches[i] += 1
+        nLines += 1
+      prof.addFile(file[0], nLines, time.perf_counter() - fileStart)
+  elif args.jobs == 1 and not eventStore:
+    for file in tqdm(files, desc="Parsing chatlog"):
+      for timestamp,l in readChatlog(*file):
+        i = dispatcher.dispatch(data, l, timestamp)
+        if i >= 0:
+          matches[i] += 1
+  elif args.jobs == 1:
+    # The export needs the groups of every match, which parseFile() keeps.
+    for file in tqdm(files, desc="Parsing chatlog"):
+      fileEvents, nSkipped = parseFile(file)
+      replayFile(data, fileEvents[nSkipped:], matches)
+      eventStore.addFile(fileEvents)
+  else:
+    # Files are matched in parallel, but the results are handed back in
+    # date order, so the analyzers see the same sequence of lines as in
+    # a serial run.
+    import multiprocessing
+    with multiprocessing.Pool(args.jobs or None) as pool:
+      results = pool.imap(parseFile, files, chunksize=4)
+      for fileEvents,nSkipped in tqdm(results, total=len(files), desc="Parsing chatlog"):
+        replayFile(data, fileEvents[nSkipped:], matches)
+        if eventStore:
+          eventStore.addFile(fileEvents)
+  if eventStore:
+    eventStore.flush()
+  if files:
+    lastDate = files[-1][0]
+    if live and live["date"] <= lastDate:
+      del data["live"]
 
   sumTotalTime(data["players"])
   end = time.time()
   print("Duration: ", end - start)
-  print("Analyzer matches: ", matches)
+  print("Analyzer matches: ", {handler.__name__: n for (handler,_),n in zip(analyzers, matches)})
+  if args.profile:
+    report = prof.report(args.suggest_order)
+    profiler.printReport(report)
+    profiler.saveReport(args.profile, report)
   checkSessions(data["players"])
 
-  # Save resuls to database.
-  cursor = connection.cursor()
-  query = "INSERT INTO players VALUES (NULL, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);"
-  for i,(name,player) in enumerate(data["players"].items(), start=1):
-    try:
-        cursor.execute(query, (
-          name,
-          player["firstSeen"],
-          player["lastSeen"],
-          player["totalTime"].total_seconds(),
-          player["nLogins"],
-          player["nMsg"],
-          player["nSuicides"],
-          player["nChunks"],
-          player["nDuctTapes"],
-          player["nKicks"],
-          player["nMarks"],
-          player["nShouts"],
-          player["nMes"],
-          ", ".join(player["planes"])
-        ))
-    except mariadb.IntegrityError as e:
-        pass
-    player["sqlId"] = i
-
-  query = "INSERT INTO meta VALUES (DEFAULT, UTC_TIME());"
-  cursor.execute(query, ())
-
-  query = "INSERT INTO accountCleanups VALUES (DEFAULT, ?, ?);"
-  for c in data["cleanups"]:
-    cursor.execute(query, (c["timestamp"], c["n"]))
-
-  query = "INSERT INTO chunkGenerations VALUES (DEFAULT, ?, ?);"
-  for timestamp,count in data["chunkGenerations"].items():
-    cursor.execute(query, (timestamp, count))
-
-  query = "INSERT INTO mobs VALUES (DEFAULT, ?, ?);"
-  for name,count in data["deathbymob"].items():
-    cursor.execute(query, (name, count))
-
-
-  for name,player in tqdm(data["players"].items(), desc="Session analysis"):
-    query = "INSERT INTO sessions VALUES (DEFAULT, ?, ?, ?);"
-    for s in player["sessions"]:
-      if s["start"] == None or s["end"] == None:
-        continue
-      try:
-        cursor.execute(query, (player["sqlId"], s["start"], s["end"]))
-      except mariadb.IntegrityError:
-        print("Database integrity error for ", name, player["sqlId"], s["start"], s["end"])
-    continue
-
+  saveResults(connection, data, suffix,
+              chunkSize=config["db"].get("bulkChunkSize", 10000),
+              loadDataInfile=config["db"].get("loadDataInfile", False))
   connection.commit()
+  if suffix:
+    database.swapStaging(connection, suffix)
+  checkpoint.save(checkpointPath, lastDate, data)
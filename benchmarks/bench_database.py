@@ -0,0 +1,60 @@
+import os
+import sqlite3
+import pytest
+import analyze
+import database
+import configmanager
+
+
+@pytest.fixture(scope="module")
+def data(archive):
+  data = analyze.createData()
+  for file in archive:
+    for timestamp,l in analyze.readChatlog(*file):
+      analyze.dispatcher.dispatch(data, l, timestamp)
+  analyze.sumTotalTime(data["players"])
+  return data
+
+
+def bench_bulkInsertSqlite(benchmark, data):
+  """database.bulkInsert() of all sessions into an in-memory SQLite stand-in."""
+  for i,player in enumerate(data["players"].values(), start=1):
+    player.sqlId = i
+  rows = list(analyze.newSessionRows(analyze.createData() | {"players": data["players"]}))
+
+  def insert():
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE TABLE sessions (id INTEGER PRIMARY KEY, playerId INT, start TEXT, end TEXT);")
+    database.bulkInsert(connection, "sessions", ["playerId", "start", "end"], rows)
+    connection.commit()
+    return connection.execute("SELECT COUNT(*) FROM sessions;").fetchone()[0]
+  assert benchmark(insert) == len(rows)
+
+
+def bench_saveResultsMariadb(benchmark, data):
+  """analyze.saveResults() into staging tables of a scratch database.
+
+  Only runs with BENCH_DB_CONFIG set to a config file like config.json
+  whose "db" is a database the benchmark may create and drop tables in,
+  never the one of analyze.py.
+  """
+  configPath = os.environ.get("BENCH_DB_CONFIG")
+  if not configPath:
+    pytest.skip("Set BENCH_DB_CONFIG to the config file of a scratch MariaDB database.")
+  try:
+    connection = database.connect(configmanager.readConfig(configPath))
+  except (SystemExit, FileNotFoundError):
+    pytest.skip(f"Can't connect to the database of '{configPath}'.")
+
+  def save():
+    database.setup(connection, "_bench")
+    # A new save state, so everything is written every round.
+    saved = analyze.createData()["saved"]
+    analyze.saveResults(connection, data | {"saved": saved}, "_bench")
+    connection.commit()
+  try:
+    benchmark.pedantic(save, rounds=3)
+  finally:
+    cursor = connection.cursor()
+    cursor.execute("DROP TABLE IF EXISTS " + ", ".join(f"{name}_bench" for name in reversed(database.tableCreations)))
+    connection.close()
@@ -0,0 +1,55 @@
+import os
+import random
+import importlib.util
+import pytest
+
+# analyze-outback.py imports the mtschem submodule, which may not be
+# checked out. It can't be imported by its name.
+pytest.importorskip("mtschem.mtschem")
+path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analyze-outback.py")
+spec = importlib.util.spec_from_file_location("analyze_outback", path)
+outback = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(outback)
+
+
+class Schematic:
+  """Synthetic stand-in for mtschem.Schem, mostly air and rackstone with a few ores."""
+
+  def __init__(self, size: int = 64, seed: int = 0):
+    rng = random.Random(seed)
+    self.nodes = ["air", "rackstone:rackstone", "default:dirt", "rackstone:rackstone_with_gold",
+                  "rackstone:rackstone_with_diamond", "rackstone:rackstone_with_mese"]
+    weights = [40, 50, 8, 1, 0.5, 0.5]
+    self.data = {"node": [[rng.choices(range(len(self.nodes)), weights, k=size) for y in range(size)]
+                          for x in range(size)]}
+
+
+@pytest.fixture(params=["numpy", "loops"])
+def schematic(request, monkeypatch):
+  """Nested lists like mtschem.Schem for the loops, an array like
+  schemcache.Schem for NumPy.
+  """
+  schematic = Schematic()
+  if request.param == "numpy":
+    if not outback.numpy:
+      pytest.skip("NumPy is not installed.")
+    schematic.data["node"] = outback.numpy.array(schematic.data["node"], dtype=">u2")
+  else:
+    monkeypatch.setattr(outback, "numpy", None)
+  return schematic
+
+
+def bench_countBlocks(benchmark, schematic):
+  stats = benchmark(outback.count_blocks, schematic)
+  assert sum(stats.values()) == 64**3
+
+
+def bench_getBlockPositions(benchmark, schematic):
+  assert benchmark(outback.get_block_positions, schematic, "default:dirt")
+
+
+def bench_score(benchmark):
+  schematic = Schematic()
+  dirt = outback.get_block_positions(schematic, "default:dirt")
+  outback.dirt_grid = outback.spatial.Grid(dirt, 5)
+  benchmark(lambda: [outback.score(pos) for pos in dirt[:2000]])
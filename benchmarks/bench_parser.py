@@ -0,0 +1,24 @@
+import analyze
+
+
+def readLines(files):
+  return [line for file in files for line in analyze.readChatlog(*file)]
+
+
+def bench_readChatlog(benchmark, archive):
+  lines = benchmark(readLines, archive)
+  assert lines
+
+
+def bench_match(benchmark, archive):
+  """Matching only, as done by the worker processes of parallel runs."""
+  lines = readLines(archive)
+
+  def match():
+    return sum(1 for _,l in lines if analyze.dispatcher.match(l)[0] >= 0)
+  assert benchmark(match) > 0
+
+
+def bench_parseFile(benchmark, archive):
+  events, _ = benchmark(analyze.parseFile, archive[0])
+  assert events
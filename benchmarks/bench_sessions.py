@@ -0,0 +1,50 @@
+import analyze
+import sessionindex
+
+
+def analyzeLines(lines):
+  data = analyze.createData()
+  for timestamp,l in lines:
+    analyze.dispatcher.dispatch(data, l, timestamp)
+  analyze.sumTotalTime(data["players"])
+  return data
+
+
+def bench_analyze(benchmark, archive):
+  """Matching and all analyzers, i.e. the hot loop of a serial run."""
+  lines = [line for file in archive for line in analyze.readChatlog(*file)]
+  data = benchmark(analyzeLines, lines)
+  assert data["players"]
+
+
+def bench_sessionBookkeeping(benchmark, archive):
+  """Only the session handlers, on the already matched joins, quits,
+  renames and shutdowns.
+  """
+  sessionAnalyzers = {analyze.analyzeJoins, analyze.analyzeQuits, analyze.analyzeRenames, analyze.parseShutdowns}
+  events = []
+  for file in archive:
+    for timestamp,l in analyze.readChatlog(*file):
+      i, res = analyze.dispatcher.match(l)
+      if i >= 0 and analyze.analyzers[i][0] in sessionAnalyzers:
+        events.append((analyze.analyzers[i][0], res, timestamp))
+
+  def replay():
+    data = analyze.createData()
+    for handler,res,timestamp in events:
+      handler(data, res, timestamp)
+    analyze.checkSessions(data["players"])
+    return data
+  assert benchmark(replay)["players"]
+
+
+def bench_sessionIndex(benchmark, archive):
+  """Who was online, at every minute of the archive."""
+  data = analyzeLines([line for file in archive for line in analyze.readChatlog(*file)])
+  index = sessionindex.SessionIndex(data)
+  first = min(index.starts)
+  moments = range(first, first + len(archive) * 86400, 60)
+
+  def query():
+    return sum(len(index.at(moment)) for moment in moments)
+  assert benchmark(query)
@@ -0,0 +1,24 @@
+# Benchmarks of the analysis on a synthetic chat archive, run with
+#   pip install -r benchmarks/requirements.txt
+#   pytest benchmarks --benchmark-autosave
+# and compare against a saved run with --benchmark-compare. The MariaDB
+# benchmark only runs with BENCH_DB_CONFIG set, see bench_database.py.
+import os
+import sys
+import pytest
+
+# The tools are top level modules of the repository.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from benchmarks import generate
+
+# Size of the synthetic archive all benchmarks share. Large enough for
+# stable timings, small enough to be generated in a few seconds.
+days = 3
+players = 300
+linesPerDay = 20000
+
+
+@pytest.fixture(scope="session")
+def archive(tmp_path_factory):
+  """:return: List of (date, path) of the synthetic day files."""
+  return generate.generateArchive(str(tmp_path_factory.mktemp("chatlogs")), days, players, linesPerDay)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+import os
+import sys
+import random
+import argparse
+import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import mobmessages
+
+# Generates synthetic day files with the message mix of the real chat
+# archive, so the analysis can be benchmarked without the archive.
+
+# Relative frequency of each kind of line.
+weights = {
+  "chat": 60,
+  "me": 2,
+  "join": 8,
+  "quit": 7,
+  "mapgenBlame": 4,
+  "mapgenAnon": 2,
+  "planeShift": 2,
+  "deathByMob": 5,
+  "murder": 2,
+  "suicide": 1,
+  "kick": 1,
+  "ductTape": 0.2,
+  "mark": 0.2,
+  "rename": 0.1,
+  "shutdown": 0.2,
+  "cleanup": 0.05,
+  "unknown": 3,
+}
+
+realms = ["Overworld", "Caverns", "Nether", "Outback", "Midfeld", "Jarkati", "Abyss"]
+mobs = ["Black-Hearted Oerkki", "Dungeon Master", "Dirt Man", "Sand Monster", "Flying Menace",
+        "Stone Man", "Wolf", "Griefer Ghost", "Sarangay", "Lava Flan"]
+words = ["hello", "hi", "anyone", "here", "help", "lag", "where", "base", "trade", "gold", "mese",
+         "diamond", "lol", "ok", "thanks", "bye", "nether", "caverns", "outback", "portal", "server"]
+
+
+
+def position(rng: random.Random):
+  return f"{rng.randint(-30000, 30000)},{rng.randint(-31000, 30000)},{rng.randint(-30000, 30000)}"
+
+
+def markedName(rng: random.Random, name: str):
+  """:return: Name as shown in chat, sometimes shouting and marked."""
+  shout = rng.random() < 0.05
+  if rng.random() < 0.1:
+    realm = rng.choice(realms) + ": " if rng.random() < 0.9 else ""
+    name += f" [{realm}{position(rng)}]"
+  return f"<!{name}!>" if shout else f"<{name}>"
+
+
+def murderMessage(rng: random.Random, killer: str):
+  """:return: A murder message of mobmessages with its placeholders filled in."""
+  message = rng.choice(mobmessages.murder_messages)
+  fills = {
+    "<an_angry_k>": lambda: f"A {rng.choice(mobmessages.kill_ang)} <{killer}>" if rng.random() < 0.5 else f"<{killer}>",
+    "<k>": lambda: f"<{killer}>",
+    "<k_himself>": lambda: "himself",
+    "<k_his>": lambda: "his",
+    "<v_himself>": lambda: "itself",
+    "<v_his>": lambda: "its",
+    "<v_him>": lambda: "him",
+    "<v_he>": lambda: "he",
+    "<n>": lambda: "a",
+    "<v>": lambda: rng.choice(mobs),
+    "<w>": lambda: "'Amethyst Sword'",
+    "<brutally>": lambda: rng.choice(mobmessages.kill_adv) + " " if rng.random() < 0.5 else "",
+    "<angry>": lambda: rng.choice(mobmessages.kill_ang) + " " if rng.random() < 0.5 else "",
+    "<slain>": lambda: rng.choice(mobmessages.kill_adj),
+    "<slew>": lambda: rng.choice(mobmessages.kill_adj2),
+    "<slay>": lambda: rng.choice(mobmessages.kill_adj3),
+    "<pain>": lambda: rng.choice(mobmessages.pain_words),
+  }
+  for placeholder,fill in fills.items():
+    while placeholder in message:
+      message = message.replace(placeholder, fill(), 1)
+  return message
+
+
+class DayGenerator:
+  """Keeps track of who is online, so joins, quits and renames are consistent
+  across all lines and days.
+  """
+
+  def __init__(self, nPlayers: int, seed: int = 0):
+    self.rng = random.Random(seed)
+    self.players = [f"Player{i}" for i in range(nPlayers)]
+    self.online = []
+    self.kinds = list(weights)
+    self.weights = list(weights.values())
+
+  def anyone(self):
+    return self.rng.choice(self.online)
+
+  def body(self, kind: str):
+    rng = self.rng
+    # Like on the server, only players that are online do something.
+    if kind == "join" or not self.online and kind not in ("mapgenAnon", "shutdown", "cleanup", "unknown"):
+      offline = [p for p in rng.sample(self.players, min(8, len(self.players))) if p not in self.online]
+      if not offline:
+        return None
+      self.online.append(offline[0])
+      return f"*** <{offline[0]}> joined the game."
+    if kind == "quit":
+      name = self.online.pop(rng.randrange(len(self.online)))
+      return f"*** <{name}> left the game." + (" (timed out)" if rng.random() < 0.1 else "")
+    if kind == "chat":
+      return markedName(rng, self.anyone()) + " " + " ".join(rng.choices(words, k=rng.randint(1, 12)))
+    if kind == "me":
+      return "* " + markedName(rng, self.anyone()) + " " + rng.choice(["waves", "coughs", "gives hamburger"])
+    if kind == "mapgenBlame":
+      return f"# Server: Mapgen scrambling. Blame <{self.anyone()}> for lag. Chunks: {rng.randint(1, 200)}."
+    if kind == "mapgenAnon":
+      return f"# Server: Mapgen working, expect lag. (Chunks: {rng.randint(1, 200)}.)"
+    if kind == "planeShift":
+      return f"# Server: <{self.anyone()}> has plane shifted to {rng.choice(realms)}."
+    if kind == "deathByMob":
+      victim = f"<{self.anyone()}>" if rng.random() < 0.9 else "An explorer"
+      angry = rng.choice(mobmessages.kill_ang) + " " if rng.random() < 0.5 else ""
+      return (f"# Server: {victim} was {rng.choice(mobmessages.kill_adv)} {rng.choice(mobmessages.kill_adj2)} "
+              f"by a {angry}{rng.choice(mobs)}.")
+    if kind == "murder":
+      return "# Server: " + murderMessage(rng, self.anyone())
+    if kind == "suicide":
+      return f"# Server: <{self.anyone()}> ended {rng.choice(['him', 'her'])}self."
+    if kind == "kick":
+      return f"# Server: <{self.anyone()}> was kicked " + rng.choice(["for being AFK too long.", "off the server."])
+    if kind == "ductTape":
+      return f"# Server: Player <{self.anyone()}>'s chat has been duct-taped!"
+    if kind == "mark":
+      return f"# Server: Player <{self.anyone()}> has been marked!"
+    if kind == "rename":
+      if not self.online:
+        return None
+      old = self.online.pop(rng.randrange(len(self.online)))
+      new = f"{old}x{rng.randint(0, 999)}"
+      self.players[self.players.index(old)] = new
+      self.online.append(new)
+      return f"# Server: Player <{old}> {rng.choice(['renamed to', 'is reidentified as'])} <{new}>!"
+    if kind == "shutdown":
+      self.online = []
+      return "# Server: " + rng.choice(["Normal shutdown.", "Exited without signal. If this is a normal "
+                                        "failure the server will restart in a few seconds."])
+    if kind == "cleanup":
+      return f"# Server: Accounts have been hoovered. {rng.randint(1000, 3000)} chars kept. Go save a stork."
+    return f"# Server: {rng.choice(words)} {position(rng)}"
+
+  def lines(self, date: datetime.date, nLines: int):
+    """Yields nLines lines of a day, in chronological order."""
+    start = datetime.datetime.combine(date, datetime.time())
+    seconds = sorted(self.rng.randrange(86400) for _ in range(nLines))
+    for second,kind in zip(seconds, self.rng.choices(self.kinds, self.weights, k=nLines)):
+      if (body := self.body(kind)) is None:
+        continue
+      timestamp = start + datetime.timedelta(seconds=second)
+      yield timestamp.strftime("[%Y/%m/%d, %H:%M:%S UTC]    ") + body + "\n"
+
+
+def generateArchive(chatlogDir: str, days: int, players: int, linesPerDay: int,
+                    firstDate: datetime.date = datetime.date(2023, 1, 1), seed: int = 0):
+  """Writes days day files into chatlogDir.
+
+  :return: List of (date, path) of the written files, like chatlog.listDays().
+  """
+  os.makedirs(chatlogDir, exist_ok=True)
+  generator = DayGenerator(players, seed)
+  files = []
+  for i in range(days):
+    date = firstDate + datetime.timedelta(days=i)
+    path = os.path.join(chatlogDir, date.isoformat())
+    with open(path, "w") as f:
+      f.writelines(generator.lines(date, linesPerDay))
+    files.append((date, path))
+  return files
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Generate a synthetic chat archive.")
+  parser.add_argument("chatlogDir", help="Directory the day files are written to.")
+  parser.add_argument("--days", type=int, default=30)
+  parser.add_argument("--players", type=int, default=500)
+  parser.add_argument("--lines", type=int, default=5000, help="Lines per day.")
+  parser.add_argument("--seed", type=int, default=0)
+  args = parser.parse_args()
+
+  generateArchive(args.chatlogDir, args.days, args.players, args.lines, seed=args.seed)
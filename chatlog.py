@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import os
+import io
+import gzip
+import zipfile
+import argparse
+import datetime
+import configmanager
+
+# Optional, only needed for zstd compressed day files.
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+# The chat archive is a directory of day files named after their date,
+# e.g. "2023-03-17". Day files may be compressed, which is told by their
+# extension, and whole months may be packed into one zip file, e.g.
+# "2023-03.zip" containing the day files of that month. Every reader
+# should go through listDays() and openDay(), so all layouts work the same.
+extensions = {
+  None: "",
+  "gzip": ".gz",
+  "zstd": ".zst",
+}
+monthExtension = ".zip"
+
+
+
+def listDays(chatlogDir: str):
+  """:return: Sorted list of (date, path) of all days in the archive.
+
+  Days packed into a month are addressed as "<month file>/<day>".
+  """
+  days = {}
+  packedDays = {}
+  for name in os.listdir(chatlogDir):
+    path = os.path.join(chatlogDir, name)
+    if name.endswith(monthExtension):
+      with zipfile.ZipFile(path) as month:
+        for member in month.namelist():
+          if (date := dateFromName(member)):
+            packedDays[date] = path + "/" + member
+    elif (date := dateFromName(name)):
+      days[date] = path
+  # Loose day files take precedence over packed ones.
+  return sorted((packedDays | days).items())
+
+
+def dateFromName(name: str):
+  """:return: The date of a day file name, None for other files, e.g. partial downloads."""
+  for extension in extensions.values():
+    if extension and name.endswith(extension):
+      name = name[:-len(extension)]
+      break
+  try:
+    return datetime.date.fromisoformat(name)
+  except ValueError:
+    return None
+
+
+def dayPath(chatlogDir: str, date: datetime.date, compression: str = None):
+  return os.path.join(chatlogDir, date.isoformat() + extensions[compression])
+
+
+def openDay(path: str, mode: str = "r", compression: str = None):
+  """Open a day file as a text stream, decompressing on the fly.
+
+  :param path: Path as returned by listDays() or dayPath().
+  :param mode: "r" for reading, "w" for writing.
+  :param compression: Compression for writing, when reading it is told
+                      by the file name.
+  """
+  monthPath, packed, member = path.rpartition(monthExtension + "/")
+  if packed and mode == "r":
+    # The member keeps the underlying file open until it is closed itself.
+    with zipfile.ZipFile(monthPath + monthExtension) as month:
+      return io.TextIOWrapper(month.open(member))
+
+  if mode == "r":
+    compression = None
+    for c,extension in extensions.items():
+      if extension and path.endswith(extension):
+        compression = c
+  if compression == "gzip":
+    return gzip.open(path, mode + "t")
+  if compression == "zstd":
+    if not zstandard:
+      raise RuntimeError("Reading and writing zstd compressed chatlogs needs the zstandard package.")
+    return zstandard.open(path, mode + "t")
+  return open(path, mode)
+
+
+def packMonth(chatlogDir: str, days: list):
+  """Pack the given days of one month into a month file and delete them.
+
+  :param days: List of (date, path) as returned by listDays().
+  """
+  date = days[0][0]
+  monthPath = os.path.join(chatlogDir, date.strftime("%Y-%m") + monthExtension)
+  tmpPath = monthPath + ".part"
+  with zipfile.ZipFile(tmpPath, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as month:
+    for date,path in days:
+      with openDay(path) as f:
+        month.writestr(date.isoformat(), f.read())
+  os.replace(tmpPath, monthPath)
+  for date,path in days:
+    if monthExtension + "/" not in path:
+      os.remove(path)
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Pack the day files of all past months into month files.")
+  args = parser.parse_args()
+
+  chatlogDir = configmanager.readConfig()["chatlogDir"]
+  thisMonth = datetime.date.today().replace(day=1)
+  months = {}
+  for date,path in listDays(chatlogDir):
+    if date < thisMonth:
+      months.setdefault((date.year, date.month), []).append((date, path))
+  for (year, month),days in months.items():
+    # Skip months that are already packed completely.
+    if all(monthExtension + "/" in path for _,path in days):
+      continue
+    print(f"Packing {year}-{month:02}")
+    packMonth(chatlogDir, days)
@@ -0,0 +1,77 @@
+import os
+import fcntl
+import pickle
+
+# Bump whenever the layout of the analysis state changes. Checkpoints of
+# other versions are ignored, which results in a full analysis.
+version = 7
+
+# Exit code of analyze.py and live.py when another process holds the
+# checkpoint lock, see lock().
+lockedExitCode = 75
+
+
+def loadVersioned(path: str, version: int, kind: str = "checkpoint", fallback: str = "analyzing everything"):
+  """Load a dict written by saveVersioned() with the same version.
+
+  :param kind, fallback: Describe the file and what happens without it
+                         in the message printed if it can't be used.
+  :return: The dict without its version, or None if the file doesn't
+           exist or has another version.
+  """
+  try:
+    with open(path, "rb") as f:
+      payload = pickle.load(f)
+  except FileNotFoundError:
+    print(f"No {kind} found at '{path}', {fallback}.")
+    return None
+
+  if payload.pop("version", None) != version:
+    print(f"{kind.capitalize()} '{path}' has an incompatible version, {fallback}.")
+    return None
+  return payload
+
+
+def saveVersioned(path: str, version: int, payload: dict):
+  """Save a dict along with its version.
+
+  The file is written to a temporary file first, so an interrupted run
+  never leaves a truncated file behind.
+  """
+  tmpPath = path + ".tmp"
+  with open(tmpPath, "wb") as f:
+    pickle.dump({"version": version, **payload}, f, protocol=pickle.HIGHEST_PROTOCOL)
+  os.replace(tmpPath, path)
+
+
+def load(path: str):
+  """Load the analysis state written by a previous run.
+
+  :return: Tuple of the date of the last analyzed chatlog file and the
+           analysis state, or None if there is no usable checkpoint.
+  """
+  checkpoint = loadVersioned(path, version)
+  if checkpoint is None:
+    return None
+  return checkpoint["lastDate"], checkpoint["data"]
+
+
+def save(path: str, lastDate, data: dict):
+  """Save the analysis state after the chatlog file of lastDate."""
+  saveVersioned(path, version, {"lastDate": lastDate, "data": data})
+
+
+def lock(path: str):
+  """Take an exclusive lock on the checkpoint at path, so only a single
+  process resumes from and writes it. The lock is held until the
+  returned file is closed or the process exits.
+
+  :return: The open lock file, None if another process holds the lock.
+  """
+  f = open(path + ".lock", "w")
+  try:
+    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except BlockingIOError:
+    f.close()
+    return None
+  return f
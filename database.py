@@ -1,3 +1,7 @@
+import os
+import datetime
+import tempfile
+import itertools
 import mariadb
 
 
@@ -10,7 +14,9 @@ def connect(config):
         host = dbConf["host"],
         port = dbConf["port"],
         database = dbConf["database"],
-        autocommit = False
+        autocommit = False,
+        # Needed for LOAD DATA LOCAL INFILE, see bulkInsert().
+        local_infile = dbConf.get("loadDataInfile", False)
     )
   except mariadb.Error as e:
     print(f"Error connecting to MariaDB Platform: {e}")
@@ -19,14 +25,10 @@ def connect(config):
   return connection
 
 
-def setup(connection):
-  cursor = connection.cursor()
-
-  # Drop some tables first to relax foreign key constraints.
-  cursor.execute("DROP TABLE IF EXISTS sessions;")
-
-  # Will create table. If it exists, drop it first.
-  playersTableCreation = """CREATE OR REPLACE TABLE players (
+# Tables written by analyze.py, in order of creation. {suffix} is appended
+# to all table names, which is used to build staging tables.
+tableCreations = {
+  "players": """CREATE OR REPLACE TABLE players{suffix} (
     id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
     name TINYTEXT NOT NULL UNIQUE,
     firstSeen DATETIME,
@@ -43,45 +45,139 @@ def setup(connection):
     nMes INT UNSIGNED,
     planes MEDIUMTEXT
   )
-  CHARACTER SET 'utf8mb4' COLLATE 'utf8mb4_de_pb_0900_as_cs';"""
+  CHARACTER SET 'utf8mb4' COLLATE 'utf8mb4_de_pb_0900_as_cs';""",
 
-  mobsTableCreation = """CREATE OR REPLACE TABLE mobs (
+  "meta": """CREATE OR REPLACE TABLE meta{suffix} (
     id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-    name TINYTEXT NOT NULL UNIQUE,
-    nDeaths INT UNSIGNED
-  );"""
+    analyzeDate DATETIME,
+    nSaves INT UNSIGNED
+  );""",
 
-  accountCleanupTableCreation = """CREATE OR REPLACE TABLE accountCleanups (
+  "mobs": """CREATE OR REPLACE TABLE mobs{suffix} (
     id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-    timestamp DATETIME NOT NULL,
-    accountsKept INT UNSIGNED
-  );"""
-
-  metaTableCreation = """CREATE OR REPLACE TABLE meta (
-    id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-    analyzeDate DATETIME
-  );"""
+    name TINYTEXT NOT NULL UNIQUE,
+    nDeaths INT UNSIGNED
+  );""",
 
-  chunkTableCreation = """CREATE OR REPLACE TABLE chunkGenerations (
+  "chunkGenerations": """CREATE OR REPLACE TABLE chunkGenerations{suffix} (
     id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
     timestamp DATE NOT NULL,
     count INT UNSIGNED
-  );"""
+  );""",
 
-  sessionsTableCreation = """CREATE OR REPLACE TABLE sessions (
+  "accountCleanups": """CREATE OR REPLACE TABLE accountCleanups{suffix} (
     id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
-    playerId INT UNSIGNED NOT NULL REFERENCES players(id),
+    timestamp DATETIME NOT NULL,
+    accountsKept INT UNSIGNED
+  );""",
+
+  "sessions": """CREATE OR REPLACE TABLE sessions{suffix} (
+    id INT UNSIGNED PRIMARY KEY AUTO_INCREMENT,
+    playerId INT UNSIGNED NOT NULL REFERENCES players{suffix}(id),
     start DATETIME NOT NULL,
     end DATETIME NOT NULL
-  );"""
+  );""",
+
+  "playerMobDeaths": """CREATE OR REPLACE TABLE playerMobDeaths{suffix} (
+    playerId INT UNSIGNED NOT NULL REFERENCES players{suffix}(id),
+    mobId INT UNSIGNED NOT NULL REFERENCES mobs{suffix}(id),
+    nDeaths INT UNSIGNED,
+    PRIMARY KEY (playerId, mobId)
+  );""",
+
+  "onlinePlayers": """CREATE OR REPLACE TABLE onlinePlayers{suffix} (
+    playerId INT UNSIGNED NOT NULL REFERENCES players{suffix}(id),
+    since DATETIME NOT NULL
+  );""",
+
+  # Players online per minute, only with a row for the minutes in which
+  # the number changed, see analytics.concurrency().
+  "concurrency": """CREATE OR REPLACE TABLE concurrency{suffix} (
+    timestamp DATETIME PRIMARY KEY,
+    nOnline INT UNSIGNED NOT NULL
+  );""",
+
+  # The sessions by the hours they overlap, see sessionindex.py. The
+  # bucket is the number of hours since the epoch. Like all DATETIMEs,
+  # start and end are in UTC, which UNIX_TIMESTAMP() would read in the
+  # time zone of the connection. TIMESTAMPDIFF() doesn't depend on it,
+  # e.g. everyone online at a UTC time t:
+  #   SELECT playerId FROM sessionBuckets
+  #   WHERE bucket = TIMESTAMPDIFF(HOUR, '1970-01-01', t) AND start <= t AND end > t;
+  "sessionBuckets": """CREATE OR REPLACE TABLE sessionBuckets{suffix} (
+    bucket INT UNSIGNED NOT NULL,
+    playerId INT UNSIGNED NOT NULL REFERENCES players{suffix}(id),
+    start DATETIME NOT NULL,
+    end DATETIME NOT NULL
+  );""",
+
+  "dailyPeaks": """CREATE OR REPLACE TABLE dailyPeaks{suffix} (
+    date DATE PRIMARY KEY,
+    peak INT UNSIGNED NOT NULL,
+    peakTime DATETIME NOT NULL
+  );""",
+}
+
+# Secondary indexes of large tables. For staging tables, they are only
+# built once all rows are loaded.
+indexCreations = [
+  "CREATE INDEX playerId ON sessions{suffix} (playerId);",
+  "CREATE INDEX bucket ON sessionBuckets{suffix} (bucket);",
+]
+
+
+def savedCount(connection):
+  """:return: Number of saves of analyze.py recorded in the meta table,
+              None if there is no meta table.
+  """
+  cursor = connection.cursor()
+  try:
+    cursor.execute("SELECT MAX(nSaves) FROM meta;")
+  except mariadb.Error:
+    return None
+  return cursor.fetchone()[0] or 0
 
 
-  cursor.execute(playersTableCreation)
-  cursor.execute(metaTableCreation)
-  cursor.execute(mobsTableCreation)
-  cursor.execute(chunkTableCreation)
-  cursor.execute(accountCleanupTableCreation)
-  cursor.execute(sessionsTableCreation)
+def setup(connection, suffix: str = ""):
+  """Create all tables of analyze.py, replacing existing ones.
+
+  :param suffix: Create staging tables with this suffix instead, which
+                 are swapped in by swapStaging() once they are loaded.
+  """
+  cursor = connection.cursor()
+
+  # Drop some tables first to relax foreign key constraints.
+  cursor.execute(f"DROP TABLE IF EXISTS sessions{suffix};")
+  cursor.execute(f"DROP TABLE IF EXISTS playerMobDeaths{suffix};")
+  cursor.execute(f"DROP TABLE IF EXISTS onlinePlayers{suffix};")
+  cursor.execute(f"DROP TABLE IF EXISTS sessionBuckets{suffix};")
+
+  for creation in tableCreations.values():
+    cursor.execute(creation.format(suffix=suffix))
+  if not suffix:
+    for creation in indexCreations:
+      cursor.execute(creation.format(suffix=suffix))
+
+
+def swapStaging(connection, suffix: str):
+  """Replace the tables of analyze.py by their loaded staging tables.
+
+  All tables are renamed in a single RENAME TABLE statement, so readers
+  either see the old or the new data set, never a mix or empty tables.
+  """
+  cursor = connection.cursor()
+  for creation in indexCreations:
+    cursor.execute(creation.format(suffix=suffix))
+
+  # RENAME TABLE needs all tables to exist, which they don't on the first run.
+  for name in tableCreations:
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {name} LIKE {name}{suffix};")
+
+  renames = ", ".join(f"{name} TO {name}_old, {name}{suffix} TO {name}" for name in tableCreations)
+  cursor.execute(f"RENAME TABLE {renames};")
+  # Drop referencing tables first.
+  oldTables = ", ".join(f"{name}_old" for name in reversed(tableCreations))
+  cursor.execute(f"DROP TABLE {oldTables};")
 
 
 
@@ -94,3 +190,61 @@ def setupOutback(connection):
   cursor = connection.cursor()
   cursor.execute(outbackTableCreation)
   connection.commit()
+
+
+
+def tsvField(value):
+  """Format a value for the default format of LOAD DATA INFILE."""
+  if value is None:
+    return "\\N"
+  if isinstance(value, datetime.datetime):
+    return value.strftime("%Y-%m-%d %H:%M:%S")
+  value = str(value)
+  return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def bulkInsert(connection, table: str, columns: list, rows, chunkSize: int = 10000,
+               loadDataInfile: bool = False, ignore: bool = False, deferChecks: bool = False):
+  """Insert many rows with as few round trips as possible.
+
+  :param rows: Iterable of tuples in the order of columns, may be a generator.
+  :param chunkSize: Number of rows sent per executemany() call.
+  :param loadDataInfile: Stream the rows through a temporary TSV file and
+                         LOAD DATA LOCAL INFILE instead. The connection
+                         has to allow local infiles, see connect().
+  :param ignore: Skip rows that violate a unique key, like INSERT IGNORE.
+  :param deferChecks: Disable unique and foreign key checks until all rows
+                      are loaded. Only use this for tables whose unique
+                      keys can't be violated by the rows, e.g. with an
+                      AUTO_INCREMENT id as the only unique key.
+  :return: Number of rows handed to the database.
+  """
+  cursor = connection.cursor()
+  if deferChecks:
+    cursor.execute("SET unique_checks = 0, foreign_key_checks = 0;")
+
+  n = 0
+  try:
+    if loadDataInfile:
+      with tempfile.NamedTemporaryFile("w", suffix=".tsv", delete=False) as f:
+        tsvPath = f.name
+        for row in rows:
+          f.write("\t".join(tsvField(v) for v in row) + "\n")
+          n += 1
+      try:
+        query = (f"LOAD DATA LOCAL INFILE '{tsvPath}' {'IGNORE ' if ignore else ''}"
+                 f"INTO TABLE {table} ({', '.join(columns)});")
+        cursor.execute(query)
+      finally:
+        os.remove(tsvPath)
+    else:
+      query = (f"INSERT {'IGNORE ' if ignore else ''}INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join('?' * len(columns))});")
+      rows = iter(rows)
+      while chunk := list(itertools.islice(rows, chunkSize)):
+        cursor.executemany(query, chunk)
+        n += len(chunk)
+  finally:
+    if deferChecks:
+      cursor.execute("SET unique_checks = 1, foreign_key_checks = 1;")
+  return n
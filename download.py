@@ -1,34 +1,211 @@
 #!/usr/bin/env python3
+import io
 import os
+import time
+import argparse
 import datetime
-from lxml import etree
+import threading
+import http.client
 import urllib.parse
-import urllib.request
-import urllib.error
+import concurrent.futures
+from lxml import etree
+import chatlog
 import configmanager
 
+# First day of the chat archive.
+firstDate = datetime.date.fromisoformat("2017-07-03")
+defaultUrl = "https://arklegacy-server.net/chat.html"
+# Bytes read from the response at once while streaming a chatlog.
+chunkSize = 64*1024
+
+# Every worker thread keeps its own connection open between requests.
+local = threading.local()
 
 
-def saveChatlog(date, saveDir):
+
+def getConnection(url: urllib.parse.SplitResult):
+  if getattr(local, "connection", None) is None:
+    if url.scheme == "https":
+      local.connection = http.client.HTTPSConnection(url.netloc, timeout=60)
+    else:
+      local.connection = http.client.HTTPConnection(url.netloc, timeout=60)
+  return local.connection
+
+
+def closeConnection():
+  if getattr(local, "connection", None) is not None:
+    local.connection.close()
+    local.connection = None
+
+
+def requestChatlog(date: datetime.date, url: str):
+  """Request the chatlog page of a day, reusing the thread's connection.
+
+  :return: The response, which has to be read completely before the
+           connection can be used for the next request.
+  """
   postDict = {
     "date": date.isoformat(),
     "submit": "Show Log From Date"
   }
   data = urllib.parse.urlencode(postDict).encode()
-  req =  urllib.request.Request("https://arklegacy-server.net/chat.html", data=data)
-  with urllib.request.urlopen(req) as resp:
-    tree = etree.parse(resp, etree.HTMLParser())
-    chatlog = tree.xpath("/html/body/main/section[1]/form/pre")[0]
-    saveFilePath = saveDir + date.isoformat()
-    with open(saveFilePath, "w") as f:
-      f.write(chatlog.text)
-      print(f"Downloading {date}")
+  url = urllib.parse.urlsplit(url)
+  path = url.path or "/"
+  headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+  connection = getConnection(url)
+  try:
+    connection.request("POST", path, body=data, headers=headers)
+    resp = connection.getresponse()
+    if resp.status != 200:
+      resp.read()
+  except:
+    # The server may have closed the kept alive connection.
+    closeConnection()
+    raise
+  if resp.status != 200:
+    raise http.client.HTTPException(f"HTTP {resp.status} {resp.reason} for {date}")
+  return resp
+
+
+def fetchChatlog(date: datetime.date, url: str):
+  """:return: The whole chatlog page of a day as bytes."""
+  resp = requestChatlog(date, url)
+  try:
+    return resp.read()
+  except:
+    closeConnection()
+    raise
+
+
+class PreWriter:
+  """lxml parser target writing the chatlog to a file while it is parsed.
+
+  Selects the same element as the XPath /html/body/main/section[1]/form/pre
+  and, like the element's text attribute, only writes the text up to its
+  first child element.
+  """
+
+  path = ("html", "body", "main", "section", "form", "pre")
+
+  def __init__(self, f):
+    self.f = f
+    # Tags of all open elements and, for every open element, how many
+    # children of each tag it had so far.
+    self.tags = []
+    self.childCounts = [{}]
+    self.inText = False
+    self.found = False
+
+  def start(self, tag, attrib):
+    counts = self.childCounts[-1]
+    counts[tag] = counts.get(tag, 0) + 1
+    self.tags.append(tag)
+    self.childCounts.append({})
+    if self.inText:
+      self.inText = False
+    elif not self.found and tuple(self.tags) == self.path and self.childCounts[3]["section"] == 1:
+      # childCounts[3] belongs to main, so this is within section[1].
+      self.inText = True
+      self.found = True
+
+  def end(self, tag):
+    self.tags.pop()
+    self.childCounts.pop()
+    self.inText = False
+
+  def data(self, text):
+    if self.inText:
+      self.f.write(text)
+
+  def close(self):
+    return self.found
+
+
+def fetchChatlogText(date: datetime.date, url: str = defaultUrl):
+  """:return: The chatlog of a day as text, as it would be saved."""
+  f = io.StringIO()
+  parser = etree.HTMLParser(target=PreWriter(f))
+  parser.feed(fetchChatlog(date, url))
+  if not parser.close():
+    raise ValueError(f"No chatlog found on the page of {date}")
+  return f.getvalue()
+
+
+def saveChatlog(date: datetime.date, saveDir: str, url: str = defaultUrl, compression: str = None):
+  """Download the chatlog of a day into saveDir.
+
+  :param compression: None, "gzip" or "zstd", see chatlog.extensions.
+  """
+  # Write to a temporary file first, so an interrupted download never
+  # leaves a truncated day file behind.
+  saveFilePath = chatlog.dayPath(saveDir, date, compression)
+  tmpFilePath = saveFilePath + ".part"
+
+  # The page is parsed while it arrives and the chatlog written as soon
+  # as it is parsed, without building the document tree.
+  resp = requestChatlog(date, url)
+  with chatlog.openDay(tmpFilePath, "w", compression) as f:
+    parser = etree.HTMLParser(target=PreWriter(f))
+    try:
+      while chunk := resp.read(chunkSize):
+        parser.feed(chunk)
+    except:
+      closeConnection()
+      raise
+    found = parser.close()
+
+  if not found:
+    # Fall back to the full document tree.
+    page = fetchChatlog(date, url)
+    tree = etree.fromstring(page, etree.HTMLParser())
+    pre = tree.xpath("/html/body/main/section[1]/form/pre")[0]
+    with chatlog.openDay(tmpFilePath, "w", compression) as f:
+      f.write(pre.text)
+
+  os.replace(tmpFilePath, saveFilePath)
+  print(f"Downloading {date}")
+
+
+def saveChatlogWithRetries(date: datetime.date, saveDir: str, url: str, compression: str, retries: int):
+  for attempt in range(retries + 1):
+    try:
+      saveChatlog(date, saveDir, url, compression)
+      return
+    except Exception as e:
+      if attempt == retries:
+        raise
+      print(f"Error on {date} ({e}), retrying...")
+      time.sleep(2**attempt)
+
+
+def downloadChatlogs(dates: list, saveDir: str, url: str = defaultUrl, compression: str = None,
+                     workers: int = 4, retries: int = 3):
+  """Download the chatlogs of all dates with a bounded number of threads.
+
+  :return: List of dates that couldn't be downloaded.
+  """
+  failed = []
+  with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+    futures = {executor.submit(saveChatlogWithRetries, date, saveDir, url, compression, retries): date
+               for date in dates}
+    for future in concurrent.futures.as_completed(futures):
+      if future.exception():
+        print(f"Giving up on {futures[future]}: {future.exception()}")
+        failed.append(futures[future])
+  return sorted(failed)
 
 
 
 if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Download all missing days of the chat archive.")
+  parser.add_argument("-j", "--jobs", type=int, default=4,
+                      help="Number of days downloaded in parallel.")
+  args = parser.parse_args()
+
   # Create save directory.
-  saveDir = configmanager.readConfig()["chatlogDir"]
+  config = configmanager.readConfig()
+  saveDir = config["chatlogDir"]
   if not os.path.exists(saveDir):
     os.mkdir(saveDir)
 
@@ -37,23 +214,16 @@ if __name__ == "__main__":
     exit()
 
   # Iterate through dates, starting with the first day of the chat archive.
-  date = datetime.date.fromisoformat("2017-07-03")
-  error_counter = 0
+  existing = {date for date,_ in chatlog.listDays(saveDir)}
+  dates = []
+  date = firstDate
   while date != datetime.date.today():
-    fileName = saveDir + date.isoformat()
-    if os.path.exists(saveDir + date.isoformat()):
-      date += datetime.timedelta(days=1)
-      continue
+    if date not in existing:
+      dates.append(date)
+    date += datetime.timedelta(days=1)
 
-    try:
-      saveChatlog(date, saveDir)
-    except:
-      error_counter += 1
-      if error_counter >= 3:
-        print("More than 3 errors, aborting.")
-        exit()
-      else:
-        print(f"Error on {date}, retrying...")
-    else:
-      date += datetime.timedelta(days=1)
-      error_counter = 0
+  failed = downloadChatlogs(dates, saveDir, config.get("chatUrl", defaultUrl),
+                            config.get("compression"), args.jobs)
+  if failed:
+    print(f"{len(failed)} days could not be downloaded, they are retried on the next run.")
+    exit()
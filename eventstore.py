@@ -0,0 +1,164 @@
+import os
+import re
+import glob
+import datetime
+import numpy
+
+# Columnar export of every event analyze.py recognized, so new statistics
+# can be computed from a few typed arrays instead of parsing the chatlog
+# again. Events are stored per month in "YYYY-MM.npz" files holding the
+# columns below as equally long arrays, in chronological order:
+#   time                  int64 epoch seconds
+#   count                 int32 chunks generated or accounts kept, else -1
+#   x, y, z               int32 position shown by a marked player, else noPosition
+#   type, player, plane,  int32 indices into the arrays typeNames, playerNames,
+#   mob, other            planeNames, mobNames and otherNames, -1 if missing
+# other holds the new name of renames and the kind of shutdowns.
+# E.g. the number of chat messages per player of a month:
+#   e = eventstore.loadMonth("events/2023-03.npz")
+#   chat = e["type"] == list(e["typeNames"]).index("chatMessage")
+#   dict(zip(e["playerNames"], numpy.bincount(e["player"][chat], minlength=len(e["playerNames"]))))
+
+stringColumns = ["type", "player", "plane", "mob", "other"]
+numberColumns = {"time": numpy.int64, "count": numpy.int32, "x": numpy.int32, "y": numpy.int32, "z": numpy.int32}
+noPosition = numpy.iinfo(numpy.int32).min
+
+markPosition = re.compile(r".*?(-?\d+),(-?\d+),(-?\d+)\]")
+
+
+
+def markedFields(g: tuple):
+  """Fields of chat messages and /me, whose name may be marked with a position."""
+  plane = g[3].rstrip(": ") if g[3] else None
+  position = markPosition.match(g[2]) if g[2] else None
+  return g[1], plane, None, -1, position.groups() if position else None, None
+
+
+def playerFields(g: tuple):
+  return g[0], None, None, -1, None, None
+
+
+def deathFields(g: tuple):
+  victim = g[0][1:-1] if g[0].startswith("<") else None
+  return victim, None, g[-1], -1, None, None
+
+
+# Maps the grammar pattern of each event type to a function extracting
+# (player, plane, mob, count, position, other) from the groups of a match.
+extractors = {
+  "chatMessage": markedFields,
+  "me": markedFields,
+  "join": playerFields,
+  "quit": playerFields,
+  "mapgenBlame": lambda g: (g[0], None, None, int(g[1]), None, None),
+  "mapgenAnon": lambda g: (None, None, None, int(g[0]), None, None),
+  "planeShift": lambda g: (g[0], g[1], None, -1, None, None),
+  "deathByMob": deathFields,
+  "shutdown": lambda g: (None, None, None, -1, None, g[0]),
+  "kick": playerFields,
+  "ductTape": playerFields,
+  "mark": playerFields,
+  "rename": lambda g: (g[0], None, None, -1, None, g[2]),
+  "suicide": playerFields,
+  "cleanup": lambda g: (None, None, None, int(g[0]), None, None),
+}
+
+
+def listMonths(directory: str):
+  """:return: Sorted list of the paths of all month files."""
+  return sorted(glob.glob(os.path.join(glob.escape(directory), "[0-9][0-9][0-9][0-9]-[0-9][0-9].npz")))
+
+
+def loadMonth(path: str):
+  """:return: Dict of all columns and string arrays of a month file."""
+  with numpy.load(path) as f:
+    return dict(f)
+
+
+class EventStore:
+  """Collects the events of one month at a time and writes them once the
+  next month starts.
+
+  Events have to be added in chronological order, as analyze.py matches
+  them. A month that was exported partly by a previous run is continued,
+  dropping its events from since on, which are analyzed again.
+  """
+
+  def __init__(self, directory: str, typeNames: list, since: int = None):
+    """:param typeNames: Grammar pattern name of each analyzer index.
+    :param since: Epoch seconds from which on previous exports are
+                  replaced, None to replace them all.
+    """
+    self.directory = directory
+    self.typeNames = typeNames
+    self.since = since
+    self.month = None
+    os.makedirs(directory, exist_ok=True)
+
+  def pathOf(self, month: str):
+    return os.path.join(self.directory, month + ".npz")
+
+  def startMonth(self, month: str):
+    self.month = month
+    self.columns = {c: [] for c in stringColumns + list(numberColumns)}
+    # Maps the strings of each string column to their index.
+    self.strings = {c: {} for c in stringColumns}
+    path = self.pathOf(month)
+    if self.since is None or not os.path.exists(path):
+      return
+    previous = loadMonth(path)
+    keep = previous["time"] < self.since
+    for c in numberColumns:
+      self.columns[c] = previous[c][keep].tolist()
+    for c in stringColumns:
+      self.strings[c] = {s: i for i,s in enumerate(previous[c + "Names"].tolist())}
+      self.columns[c] = previous[c][keep].tolist()
+
+  def intern(self, column: str, s: str):
+    if s is None:
+      return -1
+    strings = self.strings[column]
+    i = strings.get(s)
+    if i is None:
+      i = strings[s] = len(strings)
+    return i
+
+  def add(self, i: int, timestamp: datetime.datetime, groups: tuple):
+    """Adds the match of analyzer i, like Dispatcher.match() finds it."""
+    month = f"{timestamp:%Y-%m}"
+    if month != self.month:
+      self.flush()
+      self.startMonth(month)
+    typeName = self.typeNames[i]
+    player, plane, mob, count, position, other = extractors[typeName](groups)
+    columns = self.columns
+    columns["type"].append(self.intern("type", typeName))
+    columns["time"].append(int(timestamp.timestamp()))
+    columns["player"].append(self.intern("player", player))
+    columns["plane"].append(self.intern("plane", plane))
+    columns["mob"].append(self.intern("mob", mob))
+    columns["other"].append(self.intern("other", other))
+    columns["count"].append(count)
+    x, y, z = position or (noPosition,) * 3
+    columns["x"].append(int(x))
+    columns["y"].append(int(y))
+    columns["z"].append(int(z))
+
+  def addFile(self, events: list):
+    """Adds the events of analyze.parseFile()."""
+    for i,timestamp,groups in events:
+      self.add(i, timestamp, groups)
+
+  def flush(self):
+    """Writes the current month."""
+    if self.month is None:
+      return
+    arrays = {c: numpy.array(self.columns[c], dtype=numpy.int32) for c in stringColumns}
+    arrays.update({c + "Names": numpy.array(list(self.strings[c]), dtype=str) for c in stringColumns})
+    arrays.update({c: numpy.array(self.columns[c], dtype=t) for c,t in numberColumns.items()})
+    path = self.pathOf(self.month)
+    tmpPath = path + ".part"
+    with open(tmpPath, "wb") as f:
+      numpy.savez_compressed(f, **arrays)
+    os.replace(tmpPath, path)
+    self.month = None
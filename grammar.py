@@ -0,0 +1,229 @@
+import re
+import datetime
+
+from mobmessages import kill_ang
+
+# Grammar of the chatlog. All regexes are compiled once at import and
+# collected in the registry below, so that every tool parsing chatlogs
+# shares the exact same patterns. They are meant to be used with
+# Pattern.match(), i.e. anchored at the start of the string.
+patterns = {}
+
+
+def register(name: str, regex: str):
+  """Compile a regex and add it to the pattern registry.
+
+  :return: The compiled pattern.
+  """
+  if name in patterns:
+    raise ValueError(f"Pattern '{name}' is already registered.")
+  patterns[name] = re.compile(regex)
+  return patterns[name]
+
+
+# Date format switch happened on 2017-07-05
+dateRegexNew = r"\[(\d{4})/(\d{2})/(\d{2}), (\d{2}):(\d{2}):(\d{2}) UTC\][ ]*"
+serverMsgPrefix = "# Server: "
+regexNameWithMark = (
+  "<(!)?(.*?)"         # Then, capture the user name; optional ! in case of shouting: "<!boxface"
+  r"( \["              # Open a new group in case the player is marked, with coordinates show in brackets: " ["
+  "(.*?: ?)?"          # If this is the case, the realm comes next: "Caverns: "
+                       # But realms were missing at the beginning of the servers life, so this is also an optional group!
+                       # Also, there are three cases were the space after the colon is missing -_- (as of 2022-11-19)
+  r"-?\d*,-?\d*,-?\d*" # The coordinates follow, minus sign is optional: "1059,-5791,-8929"
+  r"\])?"              # Close the group for the player marking and make it optional: "]"
+  "!?>"                # And the closing chevron with optional shouting finally ending this: "!>")
+)
+
+# [2023/03/17, 00:39:01 UTC]
+# Matches the whole line prefix up to the message body.
+dateHeader = register("dateHeader", dateRegexNew)
+
+# All lines that start with a username surrounded by chevrons (< and >),
+# i.e. all user messages in public chat.
+# Example with all optional groups present:
+# <!boxface [Caverns: 1059,-5791,-8929]!> HELP
+# Example without realm:
+# <J2 [-232,-4,1]> hello?
+chatMessage = register("chatMessage", regexNameWithMark)
+
+# * <DragonsVolcanoDance> gives hamburger
+# * <Alex [-386,-6,412]> coughs
+me = register("me", r"\* " + regexNameWithMark)
+
+join = register("join", r"\*{3} <(.*?)> joined the game\.$")
+# The quit regex does not have a $ at the end, because an
+# additional comment in parenthesis may follow.
+quit = register("quit", r"\*{3} <(.*?)> left the game\.")
+
+mapgenBlame = register("mapgenBlame", serverMsgPrefix + r"Mapgen scrambling\. Blame <(.*?)> for lag. Chunks: (\d*)\.$")
+mapgenAnon = register("mapgenAnon", serverMsgPrefix + r"Mapgen working, expect lag\. \(Chunks: (\d*)\.\)$")
+
+# Server: <Nakilashiva> has plane shifted to Overworld.
+# Server: <dunks> has plane shifted to Outback. Noob!
+planeShift = register("planeShift", serverMsgPrefix + r"<(.*?)> has plane shifted to (.*?)\.$")
+
+suicide = register("suicide", serverMsgPrefix + "<(.*?)> ended (her|him)self.$")
+
+# "# Server: " .. victim .. " was " .. adv .. adj .. " by " .. an .. " " .. ang .. mname .. "."
+re_ang = "|".join(kill_ang)
+# Groups are named like the ones of mobmessages.matchMurder().
+deathByMob = register("deathByMob", serverMsgPrefix + f"(?P<victim><.*?>|An explorer) was .*? by an? ({re_ang})? ?(?P<mob>.*?)\\.$")
+
+# [2025/11/16, 07:00:04 UTC]    # Server: Accounts have been hoovered. 1660 chars kept. Go save a stork.
+cleanup = register("cleanup", serverMsgPrefix + r"Accounts have been hoovered\. (\d*) chars kept\.")
+
+# [2022/08/29, 14:55:44 UTC]    # Server: Player <DragonsVolcanoDance> is reidentified as <GordanRamsey>!
+# [2019/03/31, 19:58:46 UTC]    # Server: Player <wannabe> renamed to <MustTest>!
+rename = register("rename", serverMsgPrefix + r"Player <([^<>]*)> (renamed to|is reidentified as) <([^<>]*)>")
+
+# [2023/03/17, 00:39:01 UTC]    # Server: <Cucina> was kicked for being AFK too long.
+# [2023/03/17, 00:49:42 UTC]    # Server: <Jr> was kicked off the server.
+kick = register("kick", serverMsgPrefix + r"<(.*?)> was kicked")
+
+# [2025/11/22, 18:11:31 UTC]    # Server: Player <Q>'s chat has been duct-taped!
+ductTape = register("ductTape", serverMsgPrefix + r"Player <(.*?)>'s chat has been duct-taped")
+
+# Server: Player <linux> has been marked!
+mark = register("mark", serverMsgPrefix + r"Player <(.*?)> has been marked!")
+
+# Server: Startup complete.
+# Server: Exited without signal. If this is a normal failure the server will restart in a few seconds.
+shutdown = register("shutdown", serverMsgPrefix + "(Startup complete|Normal shutdown|Exited without signal)")
+
+# Position of boneboxes, blackboxes, ritual boxes and death beacons, e.g.
+# "... (Caverns: 1059,-5791,-8929)"
+boxPosition = register("boxPosition", r".*?\((.*?): (-?\d*?),(-?\d*?),(-?\d*?)\)")
+
+
+
+class TimestampDecoder:
+  """Decodes the "[2023/03/17, 00:39:01 UTC]" header of chatlog lines.
+
+  Instead of running dateHeader, the digits are sliced at their fixed
+  offsets. Consecutive lines often share the same second, in which case
+  the last timestamp is reused as is. Within the same minute, only the
+  seconds are added to the start of the minute.
+  """
+
+  seconds = [datetime.timedelta(seconds=s) for s in range(60)]
+
+  def __init__(self):
+    # "2023/03/17, 00:39:01" of the last decoded header.
+    self.lastKey = " " * 20
+    self.lastTimestamp = None
+    self.minuteTimestamp = None
+
+  def decode(self, l: str):
+    """:return: Tuple of the timestamp and the message body of the line,
+                (None, None) if the line doesn't start with a header.
+    """
+    if l[:1] != "[" or l[21:26] != " UTC]":
+      return None, None
+    key = l[1:21]
+    if key != self.lastKey:
+      second = key[18:20]
+      if key[17] != ":" or not second.isdigit() or second > "59":
+        return None, None
+      if key[:17] != self.lastKey[:17]:
+        digits = key[0:4] + key[5:7] + key[8:10] + key[12:14] + key[15:17]
+        if (key[4] != "/" or key[7] != "/" or key[10:12] != ", " or key[14] != ":"
+            or not digits.isdigit()):
+          return None, None
+        self.minuteTimestamp = datetime.datetime(int(key[0:4]), int(key[5:7]), int(key[8:10]),
+                                                 int(key[12:14]), int(key[15:17]),
+                                                 tzinfo=datetime.UTC)
+      self.lastKey = key
+      self.lastTimestamp = self.minuteTimestamp + self.seconds[int(second)]
+    # The header is followed by a varying number of spaces.
+    return self.lastTimestamp, l[26:].lstrip(" ")
+
+
+
+class Dispatcher:
+  """Finds the handler responsible for a chatlog line in a single scan.
+
+  Every line type starts with a distinct character ("<", "*" or "#"), so
+  the handlers are grouped by the first character of their pattern. All
+  patterns of a group are joined into one anchored alternation with a
+  named group per handler. The alternatives are tried in the order of
+  the handler list, which therefore still decides between overlapping
+  patterns.
+  """
+
+  def __init__(self, handlers: list):
+    """:param handlers: List of (handler, pattern) tuples, highest priority first."""
+    self.handlers = [handler for handler,_ in handlers]
+    self.patterns = [pattern for _,pattern in handlers]
+
+    # Maps the first character of a line to the indices of the handlers
+    # whose pattern may match it, in list order.
+    self.groups = {}
+    for i,pattern in enumerate(self.patterns):
+      regex = pattern.pattern
+      # Skip the escaping backslash of e.g. "\*".
+      firstChar = regex[1] if regex[0] == "\\" else regex[0]
+      self.groups.setdefault(firstChar, []).append(i)
+
+    # Maps the first character of a line to the combined regex and a
+    # lookup table from group index to the handler index and the range
+    # of the handler's own groups within the combined match. A group
+    # with a single handler is matched with the handler's own pattern
+    # and stores the handler index instead of the lookup table.
+    self.routes = {}
+    for firstChar,indices in self.groups.items():
+      if len(indices) == 1:
+        self.routes[firstChar] = (self.patterns[indices[0]], indices[0])
+        continue
+      combined = re.compile("|".join(f"(?P<_{i}>{self.patterns[i].pattern})" for i in indices))
+      lookup = {}
+      for i in indices:
+        k = combined.groupindex[f"_{i}"]
+        lookup[k] = (i, k, k + self.patterns[i].groups)
+      self.routes[firstChar] = (combined, lookup)
+
+  def match(self, l: str):
+    """Finds the handler for a line without calling it.
+
+    :return: Tuple of the handler index and the match object of its own
+             pattern, or a ReplayMatch of its groups if the pattern was
+             matched as part of a combined regex. (-1, None) if no
+             pattern matched.
+    """
+    route = self.routes.get(l[:1])
+    if not route:
+      return -1, None
+    regex, lookup = route
+    if not (res := regex.match(l)):
+      return -1, None
+    if type(lookup) is int:
+      return lookup, res
+    # The outermost group is the one that closed last. The handler's own
+    # groups directly follow it.
+    i, first, last = lookup[res.lastindex]
+    return i, ReplayMatch(res.groups()[first:last])
+
+  def dispatch(self, data: dict, l: str, timestamp: datetime.datetime):
+    """Calls the matching handler with the groups of its own pattern.
+
+    :return: Index of the handler that matched the line, -1 if none did.
+    """
+    i, res = self.match(l)
+    if i >= 0:
+      self.handlers[i](data, res, timestamp)
+    return i
+
+
+
+class ReplayMatch:
+  """Stands in for a match object when handlers are called with groups
+  that were matched elsewhere, e.g. in another process or as part of
+  the combined regex of a Dispatcher. Only groups() is available.
+  """
+  __slots__ = ("_groups",)
+
+  def __init__(self, groups: tuple):
+    self._groups = groups
+
+  def groups(self):
+    return self._groups
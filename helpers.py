@@ -1,15 +1,10 @@
-import copy
+import array
 import datetime
 
 
-def updateLastSeen(p: dict, time: datetime.datetime):
-  try:
-    if p["lastSeen"] < time:
-      p["lastSeen"] = time
-  except KeyError:
-    p["lastSeen"] = time
-  except TypeError:
-    p["lastSeen"] = time
+def updateLastSeen(p, time: datetime.datetime):
+  if p.lastSeen is None or p.lastSeen < time:
+    p.lastSeen = time
 
 
 def datetimeFromRegex(groups: list):
@@ -22,56 +17,98 @@ def dateFromRegex(groups: list):
   return datetime.date(*r)
 
 
+def datetimeFromEpoch(seconds: int):
+  return datetime.datetime.fromtimestamp(seconds, datetime.UTC)
+
+
+# End of a session that has not ended (yet).
+sessionOpen = -1
+
+
+class Player:
+  """Statistics of a single account.
+
+  Sessions are stored as two parallel arrays of epoch seconds. An end of
+  sessionOpen marks a session that was never closed. Deaths by mobs are
+  counted in an array indexed by mob id, see data["mobIds"] of analyze.py.
+  """
+
+  __slots__ = (
+    "nChunks",
+    "firstSeen",
+    "nLogins",
+    "nSuicides",
+    "sessionStarts",
+    "sessionEnds",
+    "nMsg",
+    "totalTime",
+    "planes",
+    "lastSeen",
+    "nDuctTapes",
+    "nKicks",
+    "nMarks",
+    "nMes",
+    "nShouts",
+    "sqlId",
+    "mobDeaths",
+
+    #"deaths",
+    #"portalSickness",
+    #"voids",
+    #"swearing",
+  )
+
+  def __init__(self, firstSeen: datetime.datetime):
+    self.nChunks = 0
+    self.firstSeen = firstSeen
+    self.nLogins = 0
+    self.nSuicides = 0
+    self.sessionStarts = array.array("q")
+    self.sessionEnds = array.array("q")
+    self.nMsg = 0
+    self.totalTime = 0 # Seconds
+    self.planes = []
+    self.lastSeen = None
+    self.nDuctTapes = 0
+    self.nKicks = 0
+    self.nMarks = 0
+    self.nMes = 0
+    self.nShouts = 0
+    self.sqlId = None
+    self.mobDeaths = array.array("l")
+
+  def sessions(self):
+    """Yields (start, end) epoch seconds of all sessions."""
+    return zip(self.sessionStarts, self.sessionEnds)
+
+
 def startSession(data: dict, name: str, timestamp: datetime.datetime):
   ensurePlayer(data["players"], name, timestamp)
-  data["players"][name]["sessions"].append({"start": timestamp, "end": None})
-  data["players"][name]["nLogins"] += 1
-  updateLastSeen(data["players"][name], timestamp)
+  p = data["players"][name]
+  p.sessionStarts.append(int(timestamp.timestamp()))
+  p.sessionEnds.append(sessionOpen)
+  p.nLogins += 1
+  updateLastSeen(p, timestamp)
   data["activeSessions"].append(name)
 
 
 def endSession(data: dict, name: str, timestamp: datetime.datetime):
   # ToDo?
-  if not data["players"].get(name):
+  if not (p := data["players"].get(name)):
     return
-  if len(data["players"][name]["sessions"]) == 0:
+  if len(p.sessionEnds) == 0:
     return
-  if data["players"][name]["sessions"][-1]["end"] != None:
+  if p.sessionEnds[-1] != sessionOpen:
     #print(f"Session of {name} on {endDate} never started")
     return
 
-  data["players"][name]["sessions"][-1]["end"] = timestamp
-  updateLastSeen(data["players"][name], timestamp)
+  p.sessionEnds[-1] = int(timestamp.timestamp())
+  updateLastSeen(p, timestamp)
   data["activeSessions"].remove(name)
 
 
-userTemplate = {
-  "nChunks": 0,
-  "firstSeen": None,
-  "nLogins": 0,
-  "nSuicides": 0,
-  "sessions": [],
-  "nMsg": 0,
-  "totalTime": datetime.timedelta(),
-  "planes": [],
-  "lastSeen": None,
-  "nDuctTapes": 0,
-  "nKicks": 0,
-  "nMarks": 0,
-  "nMes": 0,
-  "nShouts": 0,
-
-  #"deaths": 0,
-  #"portalSickness": 0,
-  #"voids": 0,
-  #"swearing": 0,
-  #"deathsByMob": {},
-}
-
-
 def ensurePlayer(players: dict, name: str, timestamp: datetime.datetime):
   if not players.get(name):
-    players[name] = copy.deepcopy(userTemplate)
-    players[name]["firstSeen"] = timestamp
+    players[name] = Player(timestamp)
     return True
   return False
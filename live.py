@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+import sys
+import time
+import argparse
+import datetime
+import analyze
+import grammar
+import database
+import download
+import checkpoint
+import configmanager
+
+# Keeps the statistics up to date during the day, instead of only after
+# the nightly analysis. It continues the checkpoint of analyze.py and
+# writes the changes to the database every interval. The checkpoint is
+# saved along, including how much of the current day was analyzed, so
+# analyze.py --incremental later only analyzes the rest of that day.
+# Both lock the checkpoint, analyze.py stops while live.py is running.
+
+
+
+class LiveAnalysis:
+  """Analyzes chatlog lines as they arrive.
+
+  The analysis state covers all days up to lastDate plus the first
+  data["live"]["lines"] lines of data["live"]["date"], counted like
+  analyze.readChatlog() yields them. Streams fed into it have to start
+  at the beginning of a day, lines that were analyzed before are skipped.
+  """
+
+  def __init__(self, data: dict, lastDate: datetime.date):
+    self.data = data
+    self.lastDate = lastDate
+    if "live" not in data:
+      data["live"] = {"date": lastDate + datetime.timedelta(days=1), "lines": 0}
+    self.live = data["live"]
+    self.decoder = grammar.TimestampDecoder()
+    # Lines of the current day seen in the current stream.
+    self.seen = 0
+    # Lines analyzed since the last flush.
+    self.nNew = 0
+
+  def restart(self):
+    """Starts a new stream, which repeats the current day from its start."""
+    self.seen = 0
+
+  def feed(self, l: str, latest: datetime.date):
+    """:param latest: Lines dated after it are skipped, no later day
+                      can have started yet.
+    """
+    timestamp, body = self.decoder.decode(l)
+    if not timestamp:
+      return
+    date = timestamp.date()
+    # Like readChatlog(), skip timestamps pasted into the chat.
+    if date < self.live["date"] or date > latest:
+      return
+    if date > self.live["date"]:
+      self.finishDay(date)
+    self.seen += 1
+    if self.seen <= self.live["lines"]:
+      return
+    analyze.dispatcher.dispatch(self.data, body, timestamp)
+    self.live["lines"] += 1
+    self.nNew += 1
+
+  def finishDay(self, date: datetime.date):
+    """Marks all days before date as completely analyzed."""
+    self.lastDate = date - datetime.timedelta(days=1)
+    self.live["date"] = date
+    self.live["lines"] = 0
+    self.seen = 0
+
+  def flush(self, connection, checkpointPath: str, dbConfig: dict):
+    """Writes the changes since the last flush in a single transaction,
+    nothing if no lines were analyzed since.
+    """
+    if not self.nNew:
+      return
+    analyze.sumTotalTime(self.data["players"])
+    analyze.saveResults(connection, self.data,
+                        chunkSize=dbConfig.get("bulkChunkSize", 10000),
+                        loadDataInfile=dbConfig.get("loadDataInfile", False))
+    connection.commit()
+    checkpoint.save(checkpointPath, self.lastDate, self.data)
+    print(f"{datetime.datetime.now():%H:%M:%S} Analyzed {self.nNew} new lines of {self.live['date']}")
+    self.nNew = 0
+
+
+def pollWeb(analysis: LiveAnalysis, url: str, interval: float, flush):
+  """Fetches the chatlog page of the current day every interval.
+
+  The page always holds the whole day, only the new lines are analyzed.
+  Days that passed since the checkpoint are caught up on first.
+  """
+  while True:
+    date = analysis.live["date"]
+    today = datetime.datetime.now(datetime.UTC).date()
+    try:
+      text = download.fetchChatlogText(date, url)
+    except Exception as e:
+      print(f"Error fetching {date} ({e}), retrying...")
+      time.sleep(interval)
+      continue
+    analysis.restart()
+    # Lines of the page dated otherwise were pasted into the chat.
+    for l in text.splitlines(keepends=True):
+      analysis.feed(l, date)
+    # The day is complete once it's over.
+    if date < today:
+      analysis.finishDay(date + datetime.timedelta(days=1))
+    flush()
+    if date >= today:
+      time.sleep(interval)
+
+
+def tailFile(analysis: LiveAnalysis, f, interval: float, flush, follow: bool = True):
+  """Analyzes the lines of a file as they are appended to it.
+
+  :param follow: Keep waiting for new lines at the end of the file,
+                 otherwise return, e.g. once a pipe is closed.
+  """
+  lastFlush = time.monotonic()
+  partial = ""
+  while True:
+    l = f.readline()
+    if l.endswith("\n"):
+      analysis.feed(partial + l, datetime.datetime.now(datetime.UTC).date())
+      partial = ""
+    elif l:
+      # The rest of the line isn't written yet.
+      partial += l
+    elif not follow:
+      break
+    else:
+      time.sleep(1)
+    if time.monotonic() - lastFlush >= interval:
+      flush()
+      lastFlush = time.monotonic()
+  flush()
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="Continuously analyze the chatlog of the current day.")
+  parser.add_argument("--file", metavar="PATH",
+                      help="Follow a local chatlog file instead of fetching the chat page, "
+                           "'-' reads from standard input until it is closed.")
+  parser.add_argument("--interval", type=float, default=60,
+                      help="Seconds between writes to the database.")
+  args = parser.parse_args()
+
+  config = configmanager.readConfig()
+  checkpointPath = config.get("checkpoint", "checkpoint.pickle")
+  checkpointLock = checkpoint.lock(checkpointPath)
+  if not checkpointLock:
+    print(f"Checkpoint '{checkpointPath}' is in use, e.g. by analyze.py, stopping.")
+    exit(checkpoint.lockedExitCode)
+  resumed = checkpoint.load(checkpointPath)
+  if not resumed:
+    print("Live analysis continues the checkpoint of analyze.py, run it first.")
+    exit()
+  lastDate, data = resumed
+
+  connection = database.connect(config)
+  if data["saved"]["nSaves"] != database.savedCount(connection):
+    print("The checkpoint doesn't match the database, run analyze.py first.")
+    exit()
+  analysis = LiveAnalysis(data, lastDate)
+  def flush():
+    analysis.flush(connection, checkpointPath, config["db"])
+
+  try:
+    if args.file == "-":
+      tailFile(analysis, sys.stdin, args.interval, flush, follow=False)
+    elif args.file:
+      with open(args.file) as f:
+        tailFile(analysis, f, args.interval, flush)
+    else:
+      pollWeb(analysis, config.get("chatUrl", download.defaultUrl), args.interval, flush)
+  except KeyboardInterrupt:
+    flush()
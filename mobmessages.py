@@ -4,8 +4,6 @@
 # https://github.com/BluebirdGreycoat/musttest_game/src/master/mods/mobs
 import re
 
-#import helpers
-
 
 kill_adj = [
 	"killed",
@@ -209,73 +207,85 @@ murder_messages = [
 
 
 
-def parseMobMessages(d, l):
-  # ToDo: Don't duplicate date regex.
-  dateRegexNew = r"^\[(\d{4})/(\d{2})/(\d{2}), (\d{2}):(\d{2}):(\d{2}) UTC\][ ]*"
-
-  killAdjGroup = "(" + "|".join(kill_adj) + ")"
-  killAngGroup = "(" + "|".join(kill_ang) + ")"
-
-  # Example
-  # [2019/07/07, 16:07:25 UTC]    Server: <AyabelleFeu> was viciously wasted by an irascible Black-Hearted Oerkki.
-  pattern = dateRegexNew + fr"# Server: <(.*?)> was(.*)? {killAdjGroup} by an? ?{killAngGroup}? (.*?)\.$"
-  res = re.search(pattern, l)
-  if res:
-    name = res.groups()[6]
-    mob = res.groups()[10]
-
-    helpers.createPlayer(d, name)
-    mobArray = d[name]["deathsByMob"]
-    if not mobArray.get(mob):
-      mobArray[mob] = 1
-    else:
-      mobArray[mob] += 1
-    return True
-
-  return False
+def parseDeadMobs(d, l):
+  """:return: Whether the message body l is a murder message."""
+  return matchMurder(l) is not None
 
 
 
-def parseDeadMobs(d, l):
-  # Bugs:
-  # A displeased <Sanith> ruthlessly scrubbed a Flying Menace with his 'Amethyst Sword'
-  killAdjGroup = "(" + "|".join(kill_adj) + ")"
-  killAdj2Group = "(" + "|".join(kill_adj2) + ")"
-  killAdj3Group = "(" + "|".join(kill_adj3) + ")"
-  killAngGroup = "(" + "|".join(kill_ang) + ")"
-  killAdvGroup = "(" + "|".join(kill_adv) + ")"
-  painGroup = "(" + "|".join(pain_words) + ")"
+# Regexes of the placeholders in murder_messages. Placeholders of the
+# killer, victim and weapon are named groups on their first occurrence
+# within a message and backreferences to them on later ones.
+killAdjGroup = "(?:" + "|".join(kill_adj) + ")"
+killAdj2Group = "(?:" + "|".join(kill_adj2) + ")"
+killAdj3Group = "(?:" + "|".join(kill_adj3) + ")"
+killAngGroup = "(?:" + "|".join(kill_ang) + ")"
+killAdvGroup = "(?:" + "|".join(kill_adv) + ")"
+painGroup = "(?:" + "|".join(pain_words) + ")"
 
-  for i in range(len(murder_messages)):
-    m = murder_messages[i]
-    m = m.replace("<k_himself>", "(himself|herself|itself)")
-    m = m.replace("<k_his>", "(his|her|its)")
+murder_placeholders = {
+  "<k_himself>": "(?:himself|herself|itself)",
+  "<k_his>": "(?:his|her|its)",
+  "<v_himself>": "(?:himself|herself|itself)",
+  "<v_his>": "(?:his|her|its)",
+  "<v_him>": "him",
+  "<v_he>": "he",
+  "<n>": "[Aa]n?",
+  "<brutally>": f"(?:{killAdvGroup} )?",
+  "<angry>": f"(?:{killAngGroup} )?",
+  "<slain>": killAdjGroup,
+  "<slew>": killAdj2Group,
+  "<slay>": killAdj3Group,
+  "<pain>": painGroup,
+}
+# Names never contain chevrons and mob names no periods, so a name can't
+# stretch over the rest of a line that only starts like a message.
+murder_groups = {
+  "<an_angry_k>": (f"(?:[Aa]n? {killAngGroup} )?<(?P<killer>[^<>]*?)>", "<(?P=killer)>"),
+  "<k>": ("<?(?P<killer>[^<>]*?)>?", "<?(?P=killer)>?"),
+  "<w>": ("(?P<weapon>.*?)", "(?P=weapon)"),
+  "<v>": ("(?P<victim>[^<>.]*?)", "(?P=victim)"),
+}
 
-    m = m.replace("<v_himself>", "(himself|herself|itself)")
-    m = m.replace("<v_his>", "(his|her|its)")
-    m = m.replace("<v_him>", "(him)")
-    m = m.replace("<v_he>", "(he)")
-    m = m.replace("<n>", "[Aa]n?")
 
-    m = m.replace("<brutally>", f"({killAdvGroup} )?")
-    m = m.replace("<angry>", f"({killAngGroup} )?")
+def compileMurderMessage(message: str):
+  """:return: Tuple of the longest literal part of the message, used to
+              skip the regex for most lines, and the compiled regex.
+  """
+  regex = ""
+  keyword = ""
+  defined = set()
+  for i,part in enumerate(re.split("(<[a-z_]+>)", message)):
+    if i % 2 == 0:
+      regex += re.escape(part)
+      keyword = max(keyword, part.strip(), key=len)
+    elif part in murder_groups:
+      # <k> and <an_angry_k> share the killer group.
+      group = "killer" if part in ("<k>", "<an_angry_k>") else part
+      regex += murder_groups[part][group in defined]
+      defined.add(group)
+    else:
+      regex += murder_placeholders[part]
+  return keyword, re.compile(regex)
 
-    m = m.replace("<an_angry_k>", f"([Aa]n? {killAngGroup} )?<(.*)>")
 
-    m = m.replace("<slain>", killAdjGroup)
-    m = m.replace("<slew>", killAdj2Group)
-    m = m.replace("<slay>", killAdj3Group)
-    m = m.replace("<pain>", painGroup)
+# Compiled once, in the order of murder_messages.
+murder_patterns = [compileMurderMessage(m) for m in murder_messages]
 
-    m = m.replace("<w>", "(.*)")
-    m = m.replace("<v>", "(.*)")
-    m = m.replace("<k>", "(.*)")
 
-    murder_messages[i] = m
+def matchMurder(body: str):
+  """Matches the body of a chatlog line, i.e. without the timestamp
+  header and the server prefix, against all murder messages.
 
-  #print(murder_messages[5])
-  for m in murder_messages:
-    res = re.search(m, l)
-    if res:
-      return True
-  return False
+  :return: Dict of the killer, the victim, the weapon and the mob, each
+           None if the message doesn't name it. The mob is the victim, as
+           players only murder mobs. None if no message matched.
+  """
+  body = body.rstrip("\n")
+  for keyword,pattern in murder_patterns:
+    if keyword in body and (res := pattern.fullmatch(body)):
+      murder = dict.fromkeys(("killer", "victim", "weapon"))
+      murder.update(res.groupdict())
+      murder["mob"] = murder["victim"]
+      return murder
+  return None
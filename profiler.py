@@ -0,0 +1,151 @@
+import json
+import time
+import datetime
+import grammar
+
+
+
+class Profiler:
+  """Dispatches lines like grammar.Dispatcher while measuring every analyzer.
+
+  The patterns of the analyzers that may match a line are tried one after
+  another in list order, which is what the combined regex of the
+  dispatcher does within a single scan. Every try is timed, so the report
+  shows what each analyzer costs on the lines it matches and on the lines
+  it misses. After the first match, the remaining patterns are still
+  tried (untimed) to find out which analyzers overlap and thus have to
+  keep their relative order.
+  """
+
+  def __init__(self, dispatcher: grammar.Dispatcher):
+    self.dispatcher = dispatcher
+    n = len(dispatcher.handlers)
+    self.names = [handler.__name__ for handler in dispatcher.handlers]
+    self.calls = [0] * n
+    self.hits = [0] * n
+    self.hitTime = [0.0] * n
+    self.missTime = [0.0] * n
+    self.handlerTime = [0.0] * n
+    # Maps (i, j) to the number of lines matched by analyzer i, that
+    # analyzer j would have matched as well.
+    self.overlaps = {}
+    # List of (date, number of lines, seconds) of all parsed files.
+    self.files = []
+
+  def dispatch(self, data: dict, l: str, timestamp: datetime.datetime):
+    """:return: Index of the analyzer that matched the line, -1 if none did."""
+    perfCounter = time.perf_counter
+    patterns = self.dispatcher.patterns
+    matched = -1
+    for i in self.dispatcher.groups.get(l[:1], ()):
+      if matched >= 0:
+        if patterns[i].match(l):
+          self.overlaps[matched, i] = self.overlaps.get((matched, i), 0) + 1
+        continue
+      start = perfCounter()
+      res = patterns[i].match(l)
+      end = perfCounter()
+      self.calls[i] += 1
+      if not res:
+        self.missTime[i] += end - start
+        continue
+      self.hits[i] += 1
+      self.hitTime[i] += end - start
+      self.dispatcher.handlers[i](data, res, timestamp)
+      self.handlerTime[i] += perfCounter() - end
+      matched = i
+    return matched
+
+  def addFile(self, fileDate: datetime.date, nLines: int, seconds: float):
+    self.files.append((fileDate, nLines, seconds))
+
+  def suggestOrder(self):
+    """Suggests the analyzer order with the least expected matching time.
+
+    For a chain of independent tests, the expected cost is lowest when
+    sorted by hits per time of a single try, highest first. Analyzers
+    that matched the same line keep their relative order, so the
+    suggestion yields the same results as the current order.
+
+    :return: List of analyzer indices.
+    """
+    def priority(i):
+      if not self.calls[i]:
+        return 0
+      return self.hits[i] / ((self.hitTime[i] + self.missTime[i]) / self.calls[i])
+
+    before = {i: set() for i in range(len(self.names))}
+    for i,j in self.overlaps:
+      before[j].add(i)
+    order = []
+    remaining = set(range(len(self.names)))
+    while remaining:
+      ready = [i for i in remaining if not before[i] & remaining]
+      # Ties keep the current order.
+      best = max(ready, key=lambda i: (priority(i), -i))
+      order.append(best)
+      remaining.remove(best)
+    return order
+
+  def report(self, suggestOrder: bool = False):
+    """:return: The measurements as a JSON serializable dict."""
+    analyzers = []
+    for i,name in enumerate(self.names):
+      analyzers.append({
+        "name": name,
+        "calls": self.calls[i],
+        "hits": self.hits[i],
+        "hitTime": self.hitTime[i],
+        "missTime": self.missTime[i],
+        "handlerTime": self.handlerTime[i],
+        "totalTime": self.hitTime[i] + self.missTime[i] + self.handlerTime[i],
+      })
+    analyzers.sort(key=lambda a: a["totalTime"], reverse=True)
+
+    files = [{
+      "date": fileDate.isoformat(),
+      "lines": nLines,
+      "seconds": seconds,
+      "linesPerSecond": nLines / seconds if seconds else None,
+    } for fileDate,nLines,seconds in self.files]
+    nLines = sum(f["lines"] for f in files)
+    seconds = sum(f["seconds"] for f in files)
+
+    report = {
+      "analyzers": analyzers,
+      "files": files,
+      "lines": nLines,
+      "seconds": seconds,
+      "linesPerSecond": nLines / seconds if seconds else None,
+      "overlaps": [[self.names[i], self.names[j], n] for (i, j),n in sorted(self.overlaps.items())],
+    }
+    if suggestOrder:
+      report["currentOrder"] = self.names
+      report["suggestedOrder"] = [self.names[i] for i in self.suggestOrder()]
+    return report
+
+
+
+def printReport(report: dict):
+  """Prints a report of Profiler.report(), most expensive analyzers first."""
+  print(f"{'Analyzer':<22}{'Calls':>10}{'Hits':>10}{'Hit s':>10}{'Miss s':>10}{'Handler s':>11}{'Total s':>10}")
+  for a in report["analyzers"]:
+    print(f"{a['name']:<22}{a['calls']:>10}{a['hits']:>10}{a['hitTime']:>10.3f}"
+          f"{a['missTime']:>10.3f}{a['handlerTime']:>11.3f}{a['totalTime']:>10.3f}")
+  if report["files"]:
+    slowest = max(report["files"], key=lambda f: f["seconds"])
+    print(f"{report['lines']} lines in {len(report['files'])} files, {report['seconds']:.3f} s, "
+          f"{report['linesPerSecond'] or 0:.0f} lines/s, slowest file {slowest['date']} "
+          f"({slowest['seconds']:.3f} s)")
+  for first,second,n in report["overlaps"]:
+    print(f"{first} precedes {second}, which would match {n} of its lines as well")
+  if "suggestedOrder" in report:
+    if report["suggestedOrder"] == report["currentOrder"]:
+      print("The current analyzer order is already the best one.")
+    else:
+      print("Suggested analyzer order: " + ", ".join(report["suggestedOrder"]))
+
+
+def saveReport(path: str, report: dict):
+  with open(path, "w") as f:
+    json.dump(report, f, indent=2)
@@ -0,0 +1,80 @@
+import os
+import glob
+import zlib
+import struct
+import hashlib
+import numpy
+
+# Loads the node ids of Minetest schematics (.mts) as memory mapped arrays.
+# The node block is decompressed once and cached next to the schematic,
+# keyed by the hash of the schematic, so later loads only map the cache.
+#
+# Layout of an .mts file, all numbers big endian:
+#   "MTSM", u16 version, u16 size x, y, z,
+#   version >= 3: u8 probability of each y slice,
+#   u16 number of names, then per name u16 length and the name,
+#   zlib compressed: u16 node ids, u8 param1 and u8 param2 of all nodes,
+#   each in z, y, x order with x changing fastest.
+
+
+
+class Schem:
+  """Read-only stand-in for mtschem.Schem, with only the node ids loaded.
+
+  data["node"] is indexed as [x][y][z] like the one of mtschem.Schem.
+  It is a view of the memory mapped cache, so nothing is copied until
+  the ids are actually read.
+  """
+
+  def __init__(self, path: str):
+    with open(path, "rb") as f:
+      raw = f.read()
+    self.version, self.size, self.nodes, offset = parseHeader(raw)
+    x, y, z = self.size
+
+    cachePath = cachePathOf(path, hashlib.sha256(raw).hexdigest()[:16])
+    if not os.path.exists(cachePath):
+      writeCache(path, cachePath, raw[offset:], x*y*z)
+    ids = numpy.memmap(cachePath, dtype=">u2", mode="r", shape=(z, y, x))
+    self.data = {"node": ids.transpose(2, 1, 0)}
+
+
+def parseHeader(raw: bytes):
+  """:return: Tuple of the version, the size as (x, y, z), the node names
+              and the offset of the compressed node data.
+  """
+  if raw[:4] != b"MTSM":
+    raise ValueError("Not a Minetest schematic.")
+  version, x, y, z = struct.unpack_from(">HHHH", raw, 4)
+  offset = 12
+  if version >= 3:
+    # Skip the probabilities of the y slices.
+    offset += y
+  nNames, = struct.unpack_from(">H", raw, offset)
+  offset += 2
+  nodes = []
+  for _ in range(nNames):
+    length, = struct.unpack_from(">H", raw, offset)
+    offset += 2
+    nodes.append(raw[offset:offset + length].decode())
+    offset += length
+  return version, (x, y, z), nodes, offset
+
+
+def cachePathOf(path: str, digest: str):
+  return f"{path}.{digest}.nodes"
+
+
+def writeCache(path: str, cachePath: str, compressed: bytes, nNodes: int):
+  """Decompresses only the node ids, param1 and param2 are skipped."""
+  ids = zlib.decompressobj().decompress(compressed, 2*nNodes)
+  if len(ids) != 2*nNodes:
+    raise ValueError(f"Node data of '{path}' is truncated.")
+  tmpPath = cachePath + ".part"
+  with open(tmpPath, "wb") as f:
+    f.write(ids)
+  os.replace(tmpPath, cachePath)
+  # Caches of previous versions of the schematic are of no use anymore.
+  for stale in glob.glob(glob.escape(path) + ".*.nodes"):
+    if stale != cachePath:
+      os.remove(stale)
@@ -1,66 +1,161 @@
 #!/usr/bin/env python3
-import os
 import re
 import math
+import argparse
+import datetime
+import chatlog
+import checkpoint
+import grammar
+import spatial
 import configmanager
 
+# Bump whenever the layout of the index changes. Indexes of other versions
+# are rebuilt from scratch.
+version = 2
 
+# Lowercase keywords of the server messages announcing a box, and the kind
+# of box they belong to.
+boxKinds = {
+  "bonebox": "bonebox",
+  "blackbox": "blackbox",
+  "ritual box detected": "ritual box",
+  "death beacon": "death beacon",
+}
 
-def calcDistance(p0, p1):
-  d = (p0[0]-p1[0], p0[1]-p1[1], p0[2]-p1[2])
-  return math.sqrt(d[0]**2 + d[1]**2 + d[2]**2)
+# Edge length of the grid cells the boxes are sorted into.
+cellSize = 64
+
+coordinates = re.compile(r"(-?\d+),(-?\d+),(-?\d+)")
+
+
+
+def createIndex():
+  return {
+    # Date of the last indexed chatlog file.
+    "lastDate": None,
+    # List of (timestamp, kind, realm, pos, line) of all boxes.
+    "boxes": [],
+    # Maps lowercase realm names to a spatial grid of the box positions
+    # in that realm and the box index of each grid point.
+    "realms": {},
+    # Maps positions to the timestamps they were claimed at.
+    "claims": {},
+  }
+
+
+def loadIndex(path: str):
+  """:return: The index written by a previous run, a new one if there is none."""
+  index = checkpoint.loadVersioned(path, version, "index", "indexing everything")
+  return createIndex() if index is None else index
+
+
+def saveIndex(path: str, index: dict):
+  checkpoint.saveVersioned(path, version, index)
+
+
+def indexLine(index: dict, timestamp: datetime.datetime, body: str, l: str):
+  """Adds the box or claim of a chatlog line to the index, if it has one."""
+  ll = body.lower()
+  if "claimed" in ll:
+    if (res := coordinates.search(body)):
+      pos = tuple(int(x) for x in res.groups())
+      index["claims"].setdefault(pos, []).append(timestamp)
+    return
+
+  for keyword,kind in boxKinds.items():
+    if keyword in ll:
+      break
+  else:
+    return
+  if "id and location unknown" in ll:
+    return
+  if not body.startswith(grammar.serverMsgPrefix):
+    return
+  if not (res := grammar.boxPosition.match(body)):
+    return
+  realm = res.group(1)
+  pos = tuple(int(x) for x in res.groups()[1:])
+
+  grid, boxIndices = index["realms"].setdefault(realm.lower(), (spatial.Grid(cellSize=cellSize), []))
+  grid.add(pos)
+  boxIndices.append(len(index["boxes"]))
+  index["boxes"].append((timestamp, kind, realm, pos, l))
+
+
+def updateIndex(index: dict, chatlogDir: str):
+  """Indexes all chatlog files after the last indexed one.
+
+  :return: Number of newly indexed files.
+  """
+  lastDate = index["lastDate"]
+  nFiles = 0
+  for fileDate,fileName in chatlog.listDays(chatlogDir):
+    if lastDate and fileDate <= lastDate:
+      continue
+    # Don't index past a missing day, it would be skipped for good.
+    if lastDate and fileDate != lastDate + datetime.timedelta(days=1):
+      print(f"Chatlog of {lastDate + datetime.timedelta(days=1)} is missing, stopping there.")
+      break
+    decoder = grammar.TimestampDecoder()
+    with chatlog.openDay(fileName) as f:
+      for l in f:
+        timestamp, body = decoder.decode(l)
+        if timestamp:
+          indexLine(index, timestamp, body, l)
+    lastDate = fileDate
+    nFiles += 1
+  index["lastDate"] = lastDate
+  return nFiles
+
+
+def isClaimed(index: dict, box: tuple):
+  """:return: Whether the box was claimed after it appeared."""
+  timestamp, _, _, pos, _ = box
+  return any(claim >= timestamp for claim in index["claims"].get(pos, ()))
+
+
+def findBoxes(index: dict, center: tuple, radius: float, realms: list = None, excludeRealms: list = ()):
+  """Finds all boxes within a sphere.
+
+  :param realms: Only boxes in these realms, all realms if None.
+  :param excludeRealms: No boxes in these realms.
+  :return: Sorted list of (distance, box).
+  """
+  realms = realms and {realm.lower() for realm in realms}
+  excludeRealms = {realm.lower() for realm in excludeRealms}
+  found = []
+  for realm,(grid, boxIndices) in index["realms"].items():
+    if realms and realm not in realms or realm in excludeRealms:
+      continue
+    for d2,i in grid.withinRadius(center, radius):
+      found.append((math.sqrt(d2), index["boxes"][boxIndices[i]]))
+  found.sort(key=lambda x: (x[0], x[1][0]))
+  return found
 
 
 
 if __name__ == "__main__":
-  # Search for unclaimed boneboxes within a sphere.
-  chatlogDir = configmanager.readConfig()["chatlogDir"]
-  center = (896, 4 , 7455)
-  radius = 500
-
-  for fileName in os.listdir(chatlogDir):
-    try:
-      with open(chatlogDir + fileName) as f:
-        for l in f:
-          ll = l.lower()
-          if        not "blackbox" in ll \
-                and not "bonebox" in ll \
-                and not "ritual box detected" in ll \
-                and not "death beacon" in ll:
-            continue
-          if "outback" in ll:
-            continue
-          if "id and location unknown" in ll:
-            continue
-          if not re.search("^\[\d{4}/\d{2}/\d{2}, \d{2}:\d{2}:\d{2} UTC\][ ]*# Server:", l):
-            continue
-
-          res = re.search("\(.*?: (-?\d*?),(-?\d*?),(-?\d*?)\)", l)
-          if not res:
-            continue
-          pos = tuple(int(x) for x in res.groups())
-
-          distance = calcDistance(pos, center)
-          if distance > radius:
-            continue
-
-
-          claimed = False
-          for fileName2 in os.listdir(chatlogDir):
-            break
-            try:
-              with open(chatlogDir + fileName2) as f2:
-                for l2 in f2:
-                  if "claimed" not in l2:
-                    continue
-                  if f"{pos[0]},{pos[1]},{pos[2]}" not in l2:
-                    continue
-                  claimed = True
-            except Exception as e:
-              raise e
-          if claimed:
-            continue
-
-          print(f"{distance}: {l}", end="")
-    except Exception as e:
-      raise e
+  parser = argparse.ArgumentParser(description="Search for unclaimed boneboxes, blackboxes, ritual boxes and death beacons within a sphere.")
+  parser.add_argument("--center", type=int, nargs=3, default=(896, 4, 7455), metavar=("X", "Y", "Z"),
+                      help="Center of the sphere.")
+  parser.add_argument("--radius", type=float, default=500,
+                      help="Radius of the sphere.")
+  parser.add_argument("--realm", action="append",
+                      help="Only search this realm, can be given multiple times.")
+  parser.add_argument("--exclude-realm", action="append", default=None,
+                      help="Don't search this realm, can be given multiple times. Defaults to Outback.")
+  parser.add_argument("--claimed", action="store_true",
+                      help="Also list boxes that were claimed.")
+  args = parser.parse_args()
+
+  config = configmanager.readConfig()
+  indexPath = config.get("boneboxIndex", "boneboxes.pickle")
+  index = loadIndex(indexPath)
+  if updateIndex(index, config["chatlogDir"]):
+    saveIndex(indexPath, index)
+
+  excludeRealms = args.exclude_realm if args.exclude_realm is not None else ["Outback"]
+  for distance,box in findBoxes(index, args.center, args.radius, args.realm, excludeRealms):
+    if not args.claimed and isClaimed(index, box):
+      continue
+    print(f"{distance}: {box[4]}", end="")
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+import argparse
+import datetime
+import checkpoint
+import configmanager
+from array import array
+from helpers import sessionOpen, datetimeFromEpoch
+
+# Index of the sessions of all players by time, answering who was online
+# at a moment or during a time window. Sessions are sorted into buckets
+# of fixed length by the times they cover, so a query only looks at the
+# sessions in the buckets of its window instead of every session. The
+# sessionBuckets table of analyze.py holds the same buckets.
+
+# Seconds covered by a bucket. Most sessions fit into one or two.
+bucketSize = 3600
+
+
+
+def bucketsOf(start: int, end: int, size: int = bucketSize):
+  """:return: Range of the buckets the session from start to end overlaps."""
+  return range(start // size, max(start, end - 1) // size + 1)
+
+
+class SessionIndex:
+  """Buckets of the sessions of all players.
+
+  Queries return (name, start, end) tuples in epoch seconds, sorted by
+  start. Sessions that are still running end at sessionOpen.
+  """
+
+  def __init__(self, data: dict, size: int = bucketSize):
+    """:param data: Analysis data like analyze.py keeps it, of which the
+                 players and their running sessions are indexed.
+    """
+    self.size = size
+    self.names = []
+    self.starts = array("q")
+    self.ends = array("q")
+    # Maps bucket numbers to the indices of the sessions overlapping them.
+    self.buckets = {}
+    # Running sessions would fill every bucket from their start on, they
+    # are checked by every query instead.
+    self.running = []
+    active = set(data["activeSessions"])
+    for name,player in data["players"].items():
+      last = len(player.sessionEnds) - 1
+      for n,(start,end) in enumerate(player.sessions()):
+        # Only the last session of an active player is running, earlier
+        # open ones were left by joining again without quitting.
+        if end == sessionOpen and (n != last or name not in active):
+          continue
+        self.add(name, start, end)
+
+  def __len__(self):
+    return len(self.names)
+
+  def add(self, name: str, start: int, end: int):
+    """:return: Index of the added session."""
+    i = len(self.names)
+    self.names.append(name)
+    self.starts.append(start)
+    self.ends.append(end)
+    if end == sessionOpen:
+      self.running.append(i)
+    else:
+      for bucket in bucketsOf(start, end, self.size):
+        self.buckets.setdefault(bucket, []).append(i)
+    return i
+
+  def during(self, start: int, end: int):
+    """Finds the sessions overlapping the window from start to end,
+    excluding end.
+
+    :return: List of (name, start, end).
+    """
+    starts, ends = self.starts, self.ends
+    found = []
+    for bucket in bucketsOf(start, end, self.size):
+      for i in self.buckets.get(bucket, ()):
+        # A session spanning several buckets is only taken from the
+        # first bucket it shares with the window.
+        if starts[i] < end and ends[i] > start and max(starts[i], start) // self.size == bucket:
+          found.append(i)
+    found.extend(i for i in self.running if starts[i] < end)
+    found.sort(key=lambda i: starts[i])
+    return [(self.names[i], starts[i], ends[i]) for i in found]
+
+  def at(self, moment: int):
+    """Finds the sessions including the moment.
+
+    :return: List of (name, start, end).
+    """
+    return self.during(moment, moment + 1)
+
+
+
+def parseTime(text: str):
+  """:return: Epoch seconds of an ISO date and time, in UTC unless given."""
+  moment = datetime.datetime.fromisoformat(text)
+  if moment.tzinfo is None:
+    moment = moment.replace(tzinfo=datetime.UTC)
+  return int(moment.timestamp())
+
+
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser(description="List the players online at a time, "
+                                               "from the checkpoint of analyze.py.")
+  parser.add_argument("time", help="ISO date and time, e.g. '2023-03-17 18:30', UTC unless given.")
+  parser.add_argument("--until", metavar="TIME",
+                      help="List everyone online from time until this time instead.")
+  args = parser.parse_args()
+
+  config = configmanager.readConfig()
+  resumed = checkpoint.load(config.get("checkpoint", "checkpoint.pickle"))
+  if not resumed:
+    print("The index is built from the checkpoint of analyze.py, run it first.")
+    exit()
+  lastDate, data = resumed
+
+  index = SessionIndex(data)
+  start = parseTime(args.time)
+  sessions = index.during(start, parseTime(args.until)) if args.until else index.at(start)
+  for name,start,end in sessions:
+    until = "still online" if end == sessionOpen else f"{datetimeFromEpoch(end):%Y-%m-%d %H:%M:%S}"
+    print(f"{name:<24}{datetimeFromEpoch(start):%Y-%m-%d %H:%M:%S} - {until}")
+  print(f"{len(sessions)} sessions, analyzed up to {lastDate}")
@@ -0,0 +1,110 @@
+import itertools
+
+# Spatial index for 3D coordinates, shared by the tools searching chatlog
+# positions and schematic blocks. Points are sorted into a uniform grid of
+# cubes, so a query only looks at the points in the cubes around it instead
+# of every point. Distances are compared squared, without math.sqrt.
+
+
+
+def squaredDistance(p0, p1):
+  dx = p0[0] - p1[0]
+  dy = p0[1] - p1[1]
+  dz = p0[2] - p1[2]
+  return dx*dx + dy*dy + dz*dz
+
+
+class Grid:
+  """Uniform grid of integer or float 3D points.
+
+  Queries return (squared distance, index) tuples, where the index refers
+  to the points list, so callers can keep further data per point in a
+  list of their own.
+  """
+
+  def __init__(self, points=(), cellSize: float = 16):
+    """:param cellSize: Edge length of the cubes. Works best at around the
+                        typical query radius.
+    """
+    self.cellSize = cellSize
+    self.points = []
+    # Maps cell coordinates to the indices of the points within the cell.
+    self.cells = {}
+    for point in points:
+      self.add(point)
+
+  def __len__(self):
+    return len(self.points)
+
+  def cellOf(self, point):
+    return (int(point[0] // self.cellSize), int(point[1] // self.cellSize), int(point[2] // self.cellSize))
+
+  def add(self, point):
+    """:return: Index of the added point."""
+    i = len(self.points)
+    self.points.append(point)
+    self.cells.setdefault(self.cellOf(point), []).append(i)
+    return i
+
+  def withinRadius(self, center, radius: float, strict: bool = False):
+    """Finds all points within a sphere.
+
+    :param strict: Exclude points exactly on the surface of the sphere.
+    :return: List of (squared distance, index), nearest first.
+    """
+    r2 = radius * radius
+    low = self.cellOf([c - radius for c in center])
+    high = self.cellOf([c + radius for c in center])
+    nCells = (high[0] - low[0] + 1) * (high[1] - low[1] + 1) * (high[2] - low[2] + 1)
+    if nCells < len(self.cells):
+      cells = itertools.product(range(low[0], high[0] + 1), range(low[1], high[1] + 1), range(low[2], high[2] + 1))
+      candidates = (self.cells[cell] for cell in cells if cell in self.cells)
+    else:
+      # The sphere covers more cells than there are filled ones.
+      candidates = (indices for cell,indices in self.cells.items()
+                    if all(low[a] <= cell[a] <= high[a] for a in range(3)))
+
+    found = []
+    points = self.points
+    for indices in candidates:
+      for i in indices:
+        d2 = squaredDistance(points[i], center)
+        if d2 < r2 or d2 == r2 and not strict:
+          found.append((d2, i))
+    found.sort()
+    return found
+
+  def nearest(self, center, k: int = 1):
+    """Finds the k nearest points.
+
+    :return: List of (squared distance, index), nearest first.
+    """
+    k = min(k, len(self.points))
+    if k <= 0:
+      return []
+    c = self.cellOf(center)
+    found = []
+    ring = 0
+    while True:
+      if (2*ring + 1)**3 >= len(self.cells):
+        # The rings got larger than the filled part of the grid.
+        found = [(squaredDistance(point, center), i) for i,point in enumerate(self.points)]
+        found.sort()
+        return found[:k]
+
+      # All cells at a Chebyshev distance of ring around the center cell.
+      for dx in range(-ring, ring + 1):
+        for dy in range(-ring, ring + 1):
+          onShell = abs(dx) == ring or abs(dy) == ring
+          for dz in (range(-ring, ring + 1) if onShell else (-ring, ring)):
+            indices = self.cells.get((c[0] + dx, c[1] + dy, c[2] + dz))
+            if indices:
+              found.extend((squaredDistance(self.points[i], center), i) for i in indices)
+
+      # Points in cells further out are at least ring cells away.
+      if len(found) >= k:
+        found.sort()
+        bound = ring * self.cellSize
+        if found[k - 1][0] <= bound * bound:
+          return found[:k]
+      ring += 1
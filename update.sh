@@ -6,5 +6,13 @@ exec 2>&1 >> log
 
 date
 source env/bin/activate
-./download.py && ./analyze.py && mariadb-dump enyekala > /srv/enyekala/download/enyekala.db-dump
+if ./download.py; then
+  ./analyze.py --incremental
+  status=$?
+  # 75: live.py holds the checkpoint lock and keeps the database up to
+  # date itself, so it is dumped all the same.
+  if [ $status -eq 0 ] || [ $status -eq 75 ]; then
+    mariadb-dump enyekala > /srv/enyekala/download/enyekala.db-dump
+  fi
+fi
 echo "---"